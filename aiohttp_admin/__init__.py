@@ -6,17 +6,28 @@ from .admin import (
     setup_admin_on_rest_handlers,
     AdminOnRestHandler,
 )
+from .compression import Compression
 from .consts import PROJ_ROOT, APP_KEY
 from .security import Permissions, require, authorize
 
 
-__all__ = ['AdminHandler', 'setup', 'get_admin', 'Permissions', 'require', 'authorize', '_setup', ]
+__all__ = ['AdminHandler', 'setup', 'get_admin', 'Permissions', 'require',
+           'authorize', '_setup', 'Compression', ]
 __version__ = '0.0.2'
 
 
-def setup(app, resources, name=None, app_key=APP_KEY):
+def _setup_compression(admin_, compression):
+    # True turns compression on with default options
+    if compression is True:
+        compression = Compression()
+    if compression:
+        compression.setup(admin_)
+
+
+def setup(app, resources, name=None, app_key=APP_KEY, compression=None):
     admin_ = web.Application(loop=app.loop)
     app[app_key] = admin_
+    _setup_compression(admin_, compression)
 
     admin_handler = AdminHandler(admin_, resources=resources, name=name, loop=app.loop)
 
@@ -25,11 +36,13 @@ def setup(app, resources, name=None, app_key=APP_KEY):
     return admin_
 
 
-def _setup(app, *, schema,  title=None, app_key=APP_KEY, db=None):
+def _setup(app, *, schema,  title=None, app_key=APP_KEY, db=None,
+           compression=None):
     """Initialize the admin-on-rest admin"""
 
     admin_ = web.Application(loop=app.loop)
     app[app_key] = admin_
+    _setup_compression(admin_, compression)
 
     if title:
         schema.title = title
@@ -1,63 +1,414 @@
-from ..resource import AbstractResource, ActionResource
+import logging
+from functools import partial
+
+import trafaret as t
+
+from ..exceptions import JsonValidationError
+from ..resource import (AbstractResource, ActionResource, TEXT_SEARCH,
+                        REGEX_SEARCH, KEYSET_PAGINATION)
 # from ..security import require, Permissions
-from ..utils import json_response, validate_payload, validate_query
-from .mongo_utils import create_validator
+from ..encoders import (get_encoder, negotiated_response, read_payload,
+                        JSON_ENCODER)
+from ..utils import (validate_query, validate_bulk_data, validate_data,
+                     stream_json_response, stream_csv_response, columnar,
+                     NDJSON_FORMAT, COLUMNAR_FORMAT, ListQuery, ExportQuery,
+                     DetailQuery, ManyQuery, BulkQuery)
+from .mongo_raw import dumps_raw, decode_raw
+from .mongo_utils import (create_validator, compile_plan, compile_filters,
+                          has_text_index, compile_relations,
+                          create_partial_validator, merge_patch,
+                          validate_array_value)
 
 
 __all__ = ['MotorResource']
 
 
+log = logging.getLogger(__name__)
+
+
 class MotorResource(AbstractResource, ActionResource):
 
-    def __init__(self, collection, schema, primary_key='_id', url=None):
+    def __init__(self, collection, schema, primary_key='_id', url=None,
+                 **options):
         super().__init__(collection=collection, primary_key=primary_key, resource_name=url)
         self._collection = collection
         self._primary_key = primary_key
         self._schema = schema
         self._update_schema = create_validator(schema, primary_key)
+        self._partial_schema = create_partial_validator(schema, primary_key)
+        self._required_fields = frozenset(
+            k.name for k in schema.keys
+            if not k.optional and k.name != primary_key)
+        self._plan = compile_plan(schema)
+
+        # options override defaults declared on ActionResource,
+        # for example pagination='keyset' or count_mode='capped'
+        for name, value in options.items():
+            known = (not name.startswith('_') and
+                     hasattr(ActionResource, name) and
+                     not callable(getattr(ActionResource, name)))
+            if not known:
+                msg = 'Unknown resource option: {}'.format(name)
+                raise TypeError(msg)
+            setattr(self, name, value)
+        self._relations = compile_relations(self.relations,
+                                            self._plan.field_set)
+        if self.raw_bson and self.json_encoder != JSON_ENCODER:
+            # raw documents are written by raw_to_json, other encoder
+            # would only mix its format with the one of json.dumps
+            msg = 'raw_bson can be used only with json encoder'
+            raise ValueError(msg)
+        self._dumps = get_encoder(self.json_encoder)
+        if self.raw_bson:
+            # documents of other responses still use chosen encoder
+            self._dumps = partial(dumps_raw,
+                                  codec_options=collection.codec_options,
+                                  dumps=self._dumps)
+
+    def _response(self, request, data, **kwargs):
+        return negotiated_response(request, data, dumps=self._dumps,
+                                   **kwargs)
 
     @property
     def primary_key(self):
         return self._primary_key
 
+    def setup(self, app, base_url):
+        super().setup(app, base_url)
+        if self.text_search == TEXT_SEARCH:
+            app.on_startup.append(self._on_startup)
+        else:
+            log.info('Resource %s uses regex search for q filter',
+                     self._resource_name)
+
+    async def _on_startup(self, app):
+        await self.check_text_index()
+
+    async def check_text_index(self):
+        """Find out if collection has text index, so q filter can be
+        searched with $text query, mode of search is logged."""
+        info = await self._collection.index_information()
+        self._text_index = has_text_index(info)
+        if self._use_text_index():
+            log.info('Resource %s uses $text search for q filter',
+                     self._resource_name)
+        else:
+            log.warning('Resource %s has no text index, q filter uses '
+                        'regex search', self._resource_name)
+        return self._text_index
+
+    async def _ensure_text_index(self):
+        # index is checked lazily when admin app was not started
+        if self.text_search == TEXT_SEARCH and self._text_index is None:
+            await self.check_text_index()
+
+    async def _coalesce(self, action, args, coro_func):
+        if self.single_flight is None:
+            return await coro_func()
+        key = self.single_flight.key(self._resource_name, action, *args)
+        return await self.single_flight.do(key, coro_func)
+
+    def _validate_expand(self, q):
+        not_valid = set(q.get('_expand', ())).difference(self._relations)
+        if not_valid:
+            msg = 'Relations: {} are not declared in resource'.format(
+                ', '.join(not_valid))
+            raise JsonValidationError(msg)
+        return q
+
+    def _validate_query(self, query, trafaret):
+        # _filters are validated and compiled separately, so compiled
+        # query can be taken from filter_cache
+        query = dict(query)
+        raw_filters = query.pop('_filters', None)
+        q = validate_query(query, self._plan.field_set, trafaret)
+        self._validate_expand(q)
+        if not raw_filters:
+            return q, {}
+
+        text_index = self._use_text_index()
+
+        def compile(raw):
+            return compile_filters(raw, self._schema, self._plan,
+                                   text_index=text_index)
+
+        if self.filter_cache is None:
+            return q, compile(raw_filters)
+        # q filter compiles into $text or regex query depending on text
+        # index, which is found out at runtime
+        search_mode = TEXT_SEARCH if text_index else REGEX_SEARCH
+        filter_query = self.filter_cache.get_or_compile(
+            self._resource_name, raw_filters, compile, variant=search_mode)
+        return q, filter_query
+
     async def list(self, request):
         # await require(request, Permissions.view)
-        possible_fields = [k.name for k in self._schema.keys]
-        q = validate_query(request.query, possible_fields)
+        await self._ensure_text_index()
+        q, query = self._validate_query(request.query, ListQuery)
+
+        ndjson = q.get('_format') == NDJSON_FORMAT
+        columnar_format = q.get('_format') == COLUMNAR_FORMAT
+        if columnar_format and q.get('_stream'):
+            msg = '_stream can not be used with columnar format'
+            raise JsonValidationError(msg)
+        # expanded, columnar and keyset paged lists are not streamed
+        # unless it is asked explicitly, streamed list has no page
+        # cursors
+        keyset = (self.pagination == KEYSET_PAGINATION or
+                  '_after' in q or '_before' in q)
+        stream = (self.stream_list and '_expand' not in q and
+                  not columnar_format and not keyset)
+        if ndjson or q.get('_stream', stream):
+            return await self._stream_list(request, q, query, ndjson)
+
+        page = await self._coalesce(
+            'list', (dict(q), query),
+            lambda: self.list_(q, self._schema, query=query))
+        headers = {}
+        if page.count is not None:
+            headers['X-Total-Count'] = str(page.count)
+        if page.has_more is not None:
+            headers['X-Has-More'] = 'true' if page.has_more else 'false'
+        if page.next_cursor is not None:
+            headers['X-Next-Cursor'] = page.next_cursor
+        if page.prev_cursor is not None:
+            headers['X-Prev-Cursor'] = page.prev_cursor
+        body = page.entities
+        if columnar_format:
+            if self.raw_bson:
+                # rows are not documents, so they are encoded from
+                # decoded values
+                codec_options = self._collection.codec_options
+                body = decode_raw(body, codec_options)
+            body = columnar(body, self._list_columns(q, self._schema))
+        return self._response(request, body, headers=headers)
+
+    async def _stream_list(self, request, q, query, ndjson):
+        batch_size = self.stream_batch_size
+        cursor, count = await self.stream_list_(q, self._schema, batch_size,
+                                                query=query)
+        headers = {}
+        if count is not None:
+            headers['X-Total-Count'] = str(count)
+        try:
+            return await stream_json_response(
+                request, cursor, headers=headers, ndjson=ndjson,
+                batch_size=batch_size, dumps=self._dumps)
+        finally:
+            await cursor.close()
+
+    async def export(self, request):
+        # await require(request, Permissions.view)
+        await self._ensure_text_index()
+        q, query = self._validate_query(request.query, ExportQuery)
 
-        entities, count = await self.list_(q, self._schema)
-        headers = {'X-Total-Count': str(count)}
-        return json_response(entities, headers=headers)
+        cursor = self.export_(q, self._schema, query=query)
+        fields = q.get('_fields') or self._plan.fields
+        export_format = q['format']
+        filename = '{}.{}'.format(self._resource_name, export_format)
+        headers = {
+            'Content-Disposition': 'attachment; filename="{}"'.format(
+                filename),
+        }
+        batch_size = self.export_batch_size
+        # cursor is closed on client disconnect as well, when write fails
+        # or handler is cancelled
+        try:
+            if export_format == NDJSON_FORMAT:
+                return await stream_json_response(
+                    request, cursor, headers=headers, ndjson=True,
+                    batch_size=batch_size, dumps=self._dumps)
+            return await stream_csv_response(
+                request, cursor, fields, headers=headers,
+                batch_size=batch_size)
+        finally:
+            await cursor.close()
 
     async def detail(self, request):
         # await require(request, Permissions.view)
         entity_id = request.match_info['entity_id']
+        q = validate_query(request.query, self._plan.field_set, DetailQuery)
+        self._validate_expand(q)
+
+        projection, expand = q.get('_fields'), q.get('_expand', ())
+        slices = q.get('_slice')
+        entity = await self._coalesce(
+            'detail', (entity_id, projection, expand, slices),
+            lambda: self.detail_(entity_id, projection=projection,
+                                 expand=expand, slices=slices))
+        headers = {}
+        # client has to know that these arrays are not complete
+        sliced = self._array_slices(projection, slices)
+        if sliced:
+            headers['X-Sliced-Fields'] = ','.join(sorted(sliced))
+        return self._response(request, entity, headers=headers)
 
-        entity = await self.detail_(entity_id)
-        return json_response(entity)
+    async def many(self, request):
+        # await require(request, Permissions.view)
+        q = validate_query(request.query, self._plan.field_set, ManyQuery)
+        self._validate_expand(q)
+
+        entities, missing = await self.many_(q['ids'],
+                                             projection=q.get('_fields'),
+                                             expand=q.get('_expand', ()))
+        # ids are sent back as given, so they are never put into headers
+        return self._response(request, {'items': entities,
+                                        'missing': missing})
 
     async def create(self, request):
         # await require(request, Permissions.add)
-        raw_payload = await request.read()
-        data = validate_payload(raw_payload, self._update_schema)
+        data = validate_data(await read_payload(request),
+                             self._update_schema)
 
         doc = await self.create_(data)
+        if doc is None:
+            return self._response(request, {'status': 'created'})
+        return self._response(request, doc)
 
-        return json_response(doc)
+    async def bulk_create(self, request):
+        # await require(request, Permissions.add)
+        items = validate_bulk_data(await read_payload(request),
+                                   self._update_schema, self.bulk_max_items)
+
+        docs = [data for data, error in items if error is None]
+        written = iter(await self.bulk_create_(docs) if docs else ())
+        # validation errors and write results are merged in payload order
+        results = [next(written) if error is None else error
+                   for data, error in items]
+        failed = sum(1 for r in results if 'error' in r)
+        body = {
+            'created': len(results) - failed,
+            'failed': failed,
+            'results': results,
+        }
+        return self._response(request, body)
+
+    def _bulk_selection(self, q, query):
+        # whole collection is never selected implicitly
+        if 'ids' in q and query:
+            msg = 'Only one of ids and _filters can be supplied'
+            raise JsonValidationError(msg)
+        if 'ids' in q:
+            if len(q['ids']) > self.bulk_max_items:
+                msg = 'Too many ids, at most {} are allowed'.format(
+                    self.bulk_max_items)
+                raise JsonValidationError(msg)
+            return self._ids_query(q['ids'])
+        if not query:
+            raise JsonValidationError('ids or _filters should be supplied')
+        return query
+
+    async def bulk_update(self, request):
+        # await require(request, Permissions.edit)
+        await self._ensure_text_index()
+        q, query = self._validate_query(request.query, BulkQuery)
+        parsed = await read_payload(request)
+
+        if isinstance(parsed, list):
+            # list of {"id": ..., "data": {...}}, every document gets
+            # own fields
+            if 'ids' in q or query:
+                msg = 'ids and _filters can not be used with list of updates'
+                raise JsonValidationError(msg)
+            item = t.Dict({t.Key('id'): t.String,
+                           t.Key('data'): self._partial_schema})
+            trafaret = t.List(item, min_length=1,
+                              max_length=self.bulk_max_items)
+            items = validate_data(parsed, trafaret)
+            # empty $set is rejected by MongoDB before 5.0
+            empty = [i['id'] for i in items if not i['data']]
+            if empty:
+                msg = 'Nothing to update for ids: {}'.format(
+                    ', '.join(empty))
+                raise JsonValidationError(msg)
+            updates = [(i['id'], i['data']) for i in items]
+            result = await self.bulk_update_each_(updates,
+                                                  dry_run=q['_dryRun'])
+            return self._response(request, result)
+
+        data = validate_data(parsed, self._partial_schema)
+        if not data:
+            raise JsonValidationError('Nothing to update')
+        query = self._bulk_selection(q, query)
+        result = await self.bulk_update_(query, data, dry_run=q['_dryRun'])
+        return self._response(request, result)
+
+    async def bulk_delete(self, request):
+        # await require(request, Permissions.delete)
+        await self._ensure_text_index()
+        q, query = self._validate_query(request.query, BulkQuery)
+        query = self._bulk_selection(q, query)
+        result = await self.bulk_delete_(query, dry_run=q['_dryRun'])
+        return self._response(request, result)
 
     async def update(self, request):
         # await require(request, Permissions.edit)
         entity_id = request.match_info['entity_id']
-        raw_payload = await request.read()
-        data = validate_payload(raw_payload, self._update_schema)
+        data = validate_data(await read_payload(request),
+                             self._update_schema)
 
         doc = await self.update_(entity_id, data)
+        if doc is None:
+            return self._response(request, {'status': 'updated'})
+        return self._response(request, doc)
+
+    async def patch(self, request):
+        # await require(request, Permissions.edit)
+        entity_id = request.match_info['entity_id']
+        data, unset = merge_patch(await read_payload(request),
+                                  self._partial_schema,
+                                  self._required_fields, self._primary_key)
+        if not data and not unset:
+            raise JsonValidationError('Nothing to update')
+
+        doc = await self.patch_(entity_id, data, unset)
+        if doc is None:
+            return self._response(request, {'status': 'updated'})
+        return self._response(request, doc)
+
+    def _array_trafaret(self, field):
+        trafaret = self._plan.array_traf_map.get(field)
+        if trafaret is None:
+            msg = 'Field {} is not a list field of resource'.format(field)
+            raise JsonValidationError(msg)
+        return trafaret
+
+    async def array_length(self, request):
+        # await require(request, Permissions.view)
+        entity_id = request.match_info['entity_id']
+        field = request.match_info['field']
+        self._array_trafaret(field)
+
+        length = await self.array_length_(entity_id, field)
+        return self._response(request, {'length': length})
+
+    async def add_items(self, request):
+        # await require(request, Permissions.edit)
+        entity_id = request.match_info['entity_id']
+        field = request.match_info['field']
+        trafaret = self._array_trafaret(field)
+        # payload is {"values": [...]} with values added to the field
+        schema = t.Dict({'values': t.List(trafaret, min_length=1)})
+        data = validate_data(await read_payload(request), schema)
+
+        modified = await self.add_items_(entity_id, field, data['values'])
+        status = 'updated' if modified else 'unchanged'
+        return self._response(request, {'status': status})
+
+    async def remove_item(self, request):
+        # await require(request, Permissions.edit)
+        entity_id = request.match_info['entity_id']
+        field = request.match_info['field']
+        trafaret = self._array_trafaret(field)
+        value = validate_array_value(trafaret, request.match_info['value'])
 
-        return json_response(doc)
+        modified = await self.remove_item_(entity_id, field, value)
+        status = 'updated' if modified else 'unchanged'
+        return self._response(request, {'status': status})
 
     async def delete(self, request):
         # await require(request, Permissions.delete)
         entity_id = request.match_info['entity_id']
 
         await self.delete_(entity_id)
-        return json_response({'status': 'deleted'})
+        return self._response(request, {'status': 'deleted'})
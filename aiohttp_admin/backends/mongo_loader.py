@@ -0,0 +1,102 @@
+import asyncio
+import copy
+
+
+__all__ = ['DetailLoader']
+
+
+class DetailLoader:
+    """Batches lookups of single documents by primary key.
+
+    Lookups issued during one loop iteration, or during ``window``
+    seconds if it is given, are sent to the server as single $in query
+    and found documents are handed back to every waiting caller.
+    Lookups with different projections are batched separately.
+    """
+
+    def __init__(self, collection, primary_key='_id', *, window=0,
+                 max_batch_size=1000, loop=None):
+        self._collection = collection
+        self._primary_key = primary_key
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._loop = loop
+        # projection -> {object_id: [future, ...]}
+        self._batches = {}
+        self._handles = {}
+        # running fetches, event loop keeps only weak references to
+        # tasks, so they could be collected before they finish
+        self._tasks = set()
+
+    async def load(self, object_id, projection=None):
+        """Return document with given primary key or None when it is
+        not found."""
+        loop = self._loop or asyncio.get_event_loop()
+        key = None if projection is None else tuple(projection)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = {}
+            if self._window:
+                handle = loop.call_later(self._window, self._dispatch, key)
+            else:
+                handle = loop.call_soon(self._dispatch, key)
+            self._handles[key] = handle
+
+        future = loop.create_future()
+        batch.setdefault(object_id, []).append(future)
+        if len(batch) >= self._max_batch_size:
+            self._handles[key].cancel()
+            self._dispatch(key)
+        return await future
+
+    def _dispatch(self, key):
+        batch = self._batches.pop(key)
+        self._handles.pop(key)
+        task = asyncio.ensure_future(self._fetch(key, batch),
+                                     loop=self._loop)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, projection, batch):
+        pk = self._primary_key
+        # _id is returned by default, other primary key is added to
+        # projection, so documents can be matched to callers
+        extra_pk = (projection is not None and pk != '_id' and
+                    pk not in projection)
+        if extra_pk:
+            projection = projection + (pk,)
+
+        query = {pk: {'$in': list(batch)}}
+        try:
+            cursor = self._collection.find(query, projection=projection)
+            docs = await cursor.to_list(None)
+        except Exception as exc:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(_copy_exception(exc))
+            return
+
+        found = {doc[pk]: doc for doc in docs}
+        for object_id, futures in batch.items():
+            doc = found.get(object_id)
+            if doc is not None and extra_pk:
+                doc.pop(pk)
+            for i, future in enumerate(futures):
+                if future.done():
+                    # caller was cancelled
+                    continue
+                # every caller gets own copy of the document
+                result = doc if doc is None or i == 0 else dict(doc)
+                future.set_result(result)
+
+
+def _copy_exception(exc):
+    # every caller raises own exception, so traceback of one caller is
+    # not extended by another, failure of the query is kept as cause
+    try:
+        copied = copy.copy(exc)
+    except Exception:
+        return exc
+    copied.__cause__ = exc
+    return copied
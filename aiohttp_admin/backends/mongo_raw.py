@@ -0,0 +1,161 @@
+import datetime
+import struct
+from json.encoder import encode_basestring_ascii
+
+import bson
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.raw_bson import RawBSONDocument
+
+from ..utils import jsonify, list_separator
+
+
+__all__ = ['raw_codec_options', 'raw_to_json', 'dumps_raw', 'decode_raw']
+
+
+_INT32 = struct.Struct('<i')
+_INT64 = struct.Struct('<q')
+_DOUBLE = struct.Struct('<d')
+
+_EPOCH_NAIVE = datetime.datetime(1970, 1, 1)
+_EPOCH_AWARE = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+_INF = float('inf')
+
+
+class _Unsupported(Exception):
+    """Element can not be written without decoding, e.g. binary or
+    decimal."""
+
+
+def raw_codec_options(codec_options):
+    """Codec options which keep documents read from collection as raw
+    BSON."""
+    return codec_options.with_options(document_class=RawBSONDocument)
+
+
+def _float(value):
+    # same as json.dumps does for floats
+    if value != value:
+        return 'NaN'
+    if value == _INF:
+        return 'Infinity'
+    if value == -_INF:
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+def _datetime(millis, codec_options):
+    # same rounding as bson uses for negative values
+    diff = ((millis % 1000) + 1000) % 1000
+    delta = datetime.timedelta(seconds=(millis - diff) // 1000,
+                               microseconds=diff * 1000)
+    if not codec_options.tz_aware:
+        return _EPOCH_NAIVE + delta
+    value = _EPOCH_AWARE + delta
+    if codec_options.tzinfo is not None:
+        value = value.astimezone(codec_options.tzinfo)
+    return value
+
+
+def _write(data, pos, is_array, codec_options, out,
+           unpack_int32=_INT32.unpack_from, unpack_int64=_INT64.unpack_from,
+           unpack_double=_DOUBLE.unpack_from,
+           encode_string=encode_basestring_ascii):
+    """Write BSON document starting at ``pos`` to ``out`` as JSON and
+    return position after the document."""
+    # lookups are bound to locals and arguments, the loop runs once for
+    # every element of every document
+    append = out.append
+    find = data.index
+    end = pos + unpack_int32(data, pos)[0] - 1
+    pos += 4
+    append('[' if is_array else '{')
+    separator = ''
+    while pos < end:
+        kind = data[pos]
+        name_end = find(b'\x00', pos + 1)
+        if is_array:
+            append(separator)
+        else:
+            append(separator +
+                   encode_string(data[pos + 1:name_end].decode('utf-8')) +
+                   ': ')
+        separator = ', '
+        pos = name_end + 1
+
+        if kind == 0x02:
+            size = unpack_int32(data, pos)[0]
+            append(encode_string(data[pos + 4:pos + 3 + size].decode('utf-8')))
+            pos += 4 + size
+        elif kind == 0x07:
+            append('"' + data[pos:pos + 12].hex() + '"')
+            pos += 12
+        elif kind == 0x10:
+            append(str(unpack_int32(data, pos)[0]))
+            pos += 4
+        elif kind == 0x12:
+            append(str(unpack_int64(data, pos)[0]))
+            pos += 8
+        elif kind == 0x01:
+            append(_float(unpack_double(data, pos)[0]))
+            pos += 8
+        elif kind == 0x08:
+            append('true' if data[pos] else 'false')
+            pos += 1
+        elif kind == 0x0A:
+            append('null')
+        elif kind == 0x09:
+            try:
+                value = _datetime(unpack_int64(data, pos)[0], codec_options)
+            except OverflowError:
+                raise _Unsupported()
+            append('"' + value.isoformat() + '"')
+            pos += 8
+        elif kind == 0x03 or kind == 0x04:
+            pos = _write(data, pos, kind == 0x04, codec_options, out)
+        else:
+            raise _Unsupported()
+    append(']' if is_array else '}')
+    return end + 1
+
+
+def raw_to_json(raw, codec_options=DEFAULT_CODEC_OPTIONS):
+    """Convert BSON document to JSON in single pass, without decoding it
+    into dict first. Output is the same as ``jsonify`` produces for
+    decoded document, types which ``jsonify`` handles by decoding, like
+    binary or decimal, make the whole document go through ``jsonify``.
+    """
+    out = []
+    try:
+        _write(raw, 0, False, codec_options, out)
+    except _Unsupported:
+        return jsonify(bson.decode(raw, codec_options=codec_options))
+    return ''.join(out)
+
+
+def decode_raw(docs, codec_options=DEFAULT_CODEC_OPTIONS):
+    """Decode raw documents into dicts, nested documents included, for
+    responses which are not written from BSON directly."""
+    return [bson.decode(doc.raw, codec_options=codec_options)
+            for doc in docs]
+
+
+def dumps_raw(obj, *, codec_options=DEFAULT_CODEC_OPTIONS, dumps=jsonify):
+    """Encode RawBSONDocument or list of them into JSON bytes, other
+    values are encoded with ``dumps``. ``codec_options`` must be the
+    ones documents were read with, so datetimes keep their timezone.
+    """
+    if isinstance(obj, RawBSONDocument):
+        return raw_to_json(obj.raw, codec_options).encode('utf-8')
+    if isinstance(obj, list) and obj and isinstance(obj[0],
+                                                    RawBSONDocument):
+        # same separator as ``dumps`` uses for list, so list is encoded
+        # the same way when it is streamed
+        separator = list_separator(dumps).decode('utf-8')
+        encoded = separator.join(raw_to_json(doc.raw, codec_options)
+                                 for doc in obj)
+        return ('[' + encoded + ']').encode('utf-8')
+    encoded = dumps(obj)
+    if isinstance(encoded, str):
+        encoded = encoded.encode('utf-8')
+    return encoded
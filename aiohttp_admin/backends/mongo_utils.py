@@ -1,13 +1,45 @@
+import base64
+import binascii
+import json
 import re
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from types import MappingProxyType
+
 import trafaret as t
+from bson import json_util
+from bson.errors import BSONError
 from trafaret.contrib.object_id import MongoId
 
 from ..exceptions import JsonValidationError
-from ..utils import MULTI_FIELD_TEXT_QUERY, as_dict
+from ..utils import (MULTI_FIELD_TEXT_QUERY, ASC, as_dict,
+                     validate_filters)
+
+
+__all__ = ['create_validator', 'create_filter', 'encode_cursor',
+           'decode_cursor', 'keyset_filter', 'compile_plan', 'QueryPlan',
+           'compile_filters', 'has_text_index', 'compile_relations',
+           'create_partial_validator', 'merge_patch',
+           'validate_array_value']
 
 
-__all__ = ['create_validator', 'create_filter']
+# per schema constants used on every list request, built once
+QueryPlan = namedtuple('QueryPlan', ['schema', 'fields', 'field_set',
+                                     'column_traf_map', 'string_columns',
+                                     'array_traf_map'])
+
+
+def compile_plan(schema):
+    fields = tuple(k.name for k in schema.keys)
+    column_traf_map = MappingProxyType(
+        {k.name: k.trafaret for k in schema.keys})
+    string_columns = tuple(k.name for k in schema.keys
+                           if isinstance(k.trafaret, t.String))
+    # list fields mapped to trafaret of their elements
+    array_traf_map = MappingProxyType(
+        {k.name: k.trafaret.trafaret for k in schema.keys
+         if isinstance(k.trafaret, t.List)})
+    return QueryPlan(schema, fields, frozenset(fields), column_traf_map,
+                     string_columns, array_traf_map)
 
 
 def op(filter, field, operation, value):
@@ -81,9 +113,15 @@ def _check_value(column_traf_map, field_name, value):
     return value
 
 
-def text_filter(query, value, schema):
-    string_columns = [s.name for s in schema.keys
-                      if isinstance(s.trafaret, t.String)]
+def text_filter(query, value, schema, string_columns=None, text_index=False):
+    if text_index:
+        # single $text query is served by collection text index
+        query["$text"] = {"$search": value}
+        return query
+
+    if string_columns is None:
+        string_columns = [s.name for s in schema.keys
+                          if isinstance(s.trafaret, t.String)]
     query_list = []
     for column_name in string_columns:
         query_list.append(op(defaultdict(lambda: {}),
@@ -97,14 +135,22 @@ def text_filter(query, value, schema):
 # TODO: use functional style to create query
 # do not modify dict inside functions, modify dict on
 # same level
-def create_filter(filter, schema):
-    column_traf_map = {s.name: s.trafaret for s in schema.keys}
+def create_filter(filter, schema, plan=None, text_index=False):
+    if plan is None:
+        # only map needed for every filter, string columns are found by
+        # text_filter when text query is present
+        column_traf_map = {k.name: k.trafaret for k in schema.keys}
+        string_columns = None
+    else:
+        column_traf_map = plan.column_traf_map
+        string_columns = plan.string_columns
     query = defaultdict(lambda: {})
     for field_name, operation in filter.items():
         # case for special q filter, {"q": "text"}
         if field_name == MULTI_FIELD_TEXT_QUERY:
             value = operation
-            query = text_filter(query, value, schema)
+            query = text_filter(query, value, schema, string_columns,
+                                text_index=text_index)
             continue
         # special case {"key": "value"} check for equality
         if not isinstance(operation, dict):
@@ -119,8 +165,168 @@ def create_filter(filter, schema):
     return query
 
 
+def _plain(value):
+    # defaultdict inserts missing keys on lookup, compiled query is made
+    # of plain dicts, so lookups can not change it
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def compile_filters(raw_filters, schema, plan=None, text_index=False):
+    """Validate raw _filters argument and compile it into mongo query
+    made of plain dicts and lists. FilterCache hands out own copy of the
+    query to every request.
+    """
+    if plan is None:
+        plan = compile_plan(schema)
+    filters = validate_filters(raw_filters, plan.field_set)
+    query = create_filter(filters, schema, plan, text_index=text_index)
+    return _plain(query)
+
+
 def create_validator(schema, primary_key):
     # create validator without primary key, used for update queries
     # where pk supplied in url and rest in body
     keys = [s for s in schema.keys if s.get_name() != primary_key]
     return t.Dict().merge(keys).ignore_extra(primary_key)
+
+
+def create_partial_validator(schema, primary_key):
+    # every key is optional, used for updates which set only supplied
+    # fields, unknown fields are still rejected
+    keys = [t.Key(s.name, optional=True, trafaret=s.trafaret)
+            for s in schema.keys if s.get_name() != primary_key]
+    return t.Dict(*keys).ignore_extra(primary_key)
+
+
+def merge_patch(patch, validator, required_fields, primary_key):
+    """Translate JSON merge patch (RFC 7396) of top level fields into
+    fields to $set and fields to $unset, null removes the field.
+    Nested objects are replaced as whole values.
+
+    :param validator: validator of supplied fields, see
+        create_partial_validator
+    """
+    if not isinstance(patch, dict):
+        raise JsonValidationError('Patch should be json object')
+
+    data = {k: v for k, v in patch.items() if v is not None}
+    try:
+        data = validator(data)
+    except t.DataError as exc:
+        raise JsonValidationError(**as_dict(exc))
+
+    fields = {k.name for k in validator.keys}
+    unset = [k for k, v in patch.items()
+             if v is None and k != primary_key]
+    unknown = [k for k in unset if k not in fields]
+    if unknown:
+        errors = {k: '{} is not allowed key'.format(k) for k in unknown}
+        raise JsonValidationError(**errors)
+
+    required = set(unset).intersection(required_fields)
+    if required:
+        msg = 'Required fields can not be removed: {}'.format(
+            ', '.join(sorted(required)))
+        raise JsonValidationError(msg)
+    return data, unset
+
+
+def validate_array_value(trafaret, raw_value):
+    """Validate array element taken from url, value is parsed as JSON
+    first, so /views/5 matches integer 5, and as plain string otherwise.
+    """
+    try:
+        return trafaret.check(json.loads(raw_value))
+    except (ValueError, t.DataError):
+        pass
+    try:
+        return trafaret.check(raw_value)
+    except t.DataError as exc:
+        raise JsonValidationError(value=exc.as_dict())
+
+
+def has_text_index(index_information):
+    """Check result of collection.index_information() for text index."""
+    for index in index_information.values():
+        if any(direction == 'text' for _, direction in index['key']):
+            return True
+    return False
+
+
+def compile_relations(relations, field_set):
+    """Parse relations declared as {'author_id': 'user.username'} into
+    read only mapping of field name to (collection name, label field)."""
+    compiled = {}
+    for field_name, target in (relations or {}).items():
+        if field_name not in field_set:
+            msg = 'Relation field {} is not present in schema'.format(
+                field_name)
+            raise ValueError(msg)
+        collection_name, _, label = target.rpartition('.')
+        if not collection_name or not label:
+            msg = ('Relation {} should be declared as '
+                   '"collection.field"'.format(field_name))
+            raise ValueError(msg)
+        compiled[field_name] = (collection_name, label)
+    return MappingProxyType(compiled)
+
+
+def encode_cursor(doc, sort_field, sort_dir, primary_key):
+    # cursor holds position of the document in the sort order, sort
+    # options are stored too, so cursor can not be reused with other sort
+    position = {
+        'f': sort_field,
+        'd': sort_dir,
+        'v': doc.get(sort_field),
+        'k': doc[primary_key],
+    }
+    raw = json_util.dumps(position,
+                          json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token, sort_field, sort_dir):
+    try:
+        raw = base64.urlsafe_b64decode(token.encode('ascii'))
+        position = json_util.loads(
+            raw.decode('utf-8'),
+            json_options=json_util.CANONICAL_JSON_OPTIONS)
+        value, key = position['v'], position['k']
+        cursor_sort = position['f'], position['d']
+    except (ValueError, TypeError, KeyError, binascii.Error, BSONError):
+        raise JsonValidationError('Pagination cursor is not valid')
+
+    if cursor_sort != (sort_field, sort_dir):
+        msg = 'Pagination cursor does not match sort order'
+        raise JsonValidationError(msg)
+    return value, key
+
+
+def keyset_filter(value, key, sort_field, sort_dir, primary_key,
+                  backward=False):
+    # select documents strictly after (or before) the cursor position,
+    # primary key breaks ties between equal values of the sort field
+    forward = (sort_dir == ASC) != backward
+    operation = '$gt' if forward else '$lt'
+    if sort_field == primary_key:
+        return {primary_key: {operation: key}}
+
+    # null and missing values sort before any other value, comparison
+    # with null matches nothing, so they get own branches
+    if value is None:
+        nulls = {sort_field: None, primary_key: {operation: key}}
+        if forward:
+            return {'$or': [nulls, {sort_field: {'$ne': None}}]}
+        return nulls
+
+    clauses = [
+        {sort_field: {operation: value}},
+        {sort_field: value, primary_key: {operation: key}},
+    ]
+    if not forward:
+        clauses.append({sort_field: None})
+    return {'$or': clauses}
@@ -0,0 +1,206 @@
+import asyncio
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+
+from bson import json_util
+
+from .exceptions import AdminRESTError, JsonValidationError
+
+
+__all__ = ['LRUCache', 'CountCache', 'FilterCache', 'SingleFlight',
+           'CacheStats']
+
+
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'size', 'maxsize'])
+
+
+class LRUCache:
+    """Bounded mapping which evicts least recently used entries, entries
+    older than ``ttl`` seconds are treated as missing.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, timer=time.monotonic):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def stats(self):
+        return CacheStats(self._hits, self._misses, len(self._data),
+                          self._maxsize)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > self._timer():
+                self._data.move_to_end(key)
+                self._hits += 1
+                return value
+            del self._data[key]
+
+        self._misses += 1
+        return default
+
+    def set(self, key, value):
+        expires_at = None
+        if self._ttl is not None:
+            expires_at = self._timer() + self._ttl
+
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+class CountCache:
+    """Cache of total counts keyed by resource and normalized mongo query.
+
+    Write to the resource bumps its generation, so stale counts are never
+    returned and age out of the underlying LRU.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30, timer=time.monotonic):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        self._generations = defaultdict(int)
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    def key(self, resource_name, count_mode, query):
+        """Build cache key, key holds current generation of the resource,
+        so count calculated concurrently with a write is not stored as
+        fresh one.
+        """
+        # canonical json keeps types of values, so 1 and 1.0 differ
+        normalized = json_util.dumps(
+            query, sort_keys=True,
+            json_options=json_util.CANONICAL_JSON_OPTIONS)
+        generation = self._generations[resource_name]
+        return resource_name, generation, count_mode, normalized
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, count):
+        self._cache.set(key, count)
+
+    def invalidate(self, resource_name):
+        self._generations[resource_name] += 1
+
+    def clear(self):
+        self._cache.clear()
+
+
+def _copy_query(query):
+    """Copy dicts and lists of mongo query, values are immutable and
+    shared."""
+    if isinstance(query, dict):
+        return {k: _copy_query(v) for k, v in query.items()}
+    if isinstance(query, list):
+        return [_copy_query(v) for v in query]
+    return query
+
+
+class FilterCache:
+    """Cache of compiled mongo queries keyed by resource and raw _filters
+    string. Validation errors are cached as well, so repeated bad
+    requests fail without parsing. Every caller gets own copy of cached
+    query, so changes made by one request do not leak to others.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    def get_or_compile(self, resource_name, raw_filters, compile,
+                       variant=None):
+        """Return compiled query, ``variant`` tells apart queries which
+        compile differently from the same string, e.g. by search mode.
+        """
+        key = resource_name, variant, raw_filters
+        entry = self._cache.get(key)
+        if entry is None:
+            try:
+                entry = compile(raw_filters), None
+            except JsonValidationError as exc:
+                entry = None, (type(exc), exc.message, exc.details)
+            self._cache.set(key, entry)
+
+        query, error = entry
+        if error is not None:
+            # error is a response, so new one is raised for every request
+            exc_class, message, details = error
+            raise exc_class(message, **details)
+        return _copy_query(query)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls, callers arriving while call
+    with the same key is in flight await its result instead of running
+    own query. Result is shared between callers and must not be mutated.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._generations = defaultdict(int)
+        self._coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    @property
+    def coalesced(self):
+        """Number of calls served by already running call."""
+        return self._coalesced
+
+    def key(self, resource_name, action, *args):
+        """Build key of the call, write to the resource bumps its
+        generation, so reads issued after the write are not coalesced
+        with reads started before it.
+        """
+        normalized = json_util.dumps(
+            args, sort_keys=True,
+            json_options=json_util.CANONICAL_JSON_OPTIONS)
+        generation = self._generations[resource_name]
+        return resource_name, generation, action, normalized
+
+    async def do(self, key, coro_func):
+        future = self._calls.get(key)
+        if future is not None:
+            self._coalesced += 1
+        else:
+            future = asyncio.ensure_future(coro_func())
+            self._calls[key] = future
+
+            def done(f):
+                if self._calls.get(key) is f:
+                    del self._calls[key]
+            future.add_done_callback(done)
+        try:
+            # cancelled caller does not cancel call awaited by others
+            return await asyncio.shield(future)
+        except AdminRESTError as exc:
+            # error is a response, which can be sent only once, so every
+            # caller raises own copy
+            raise type(exc)(exc.message, status_code=exc.status_code,
+                            **exc.details) from None
+
+    def invalidate(self, resource_name):
+        self._generations[resource_name] += 1
@@ -0,0 +1,188 @@
+import asyncio
+import zlib
+
+from aiohttp import hdrs, web
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+__all__ = ['Compression', 'select_encoding', 'compress',
+           'available_encodings', 'enable_stream_compression', 'GZIP',
+           'BROTLI', 'ZSTD']
+
+
+# Python before 3.7 has only get_event_loop, which returns the running
+# loop inside coroutine as well
+_get_running_loop = getattr(asyncio, 'get_running_loop',
+                            asyncio.get_event_loop)
+
+GZIP = 'gzip'
+BROTLI = 'br'
+ZSTD = 'zstd'
+
+DEFAULT_LEVELS = {GZIP: 6, BROTLI: 4, ZSTD: 3}
+
+COMPRESSION_KEY = 'aiohttp_admin_compression'
+
+# other content, like images, is compressed already
+_COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson',
+                       'application/msgpack', 'application/javascript',
+                       'application/xml')
+
+
+def available_encodings():
+    """Content codings usable in this environment, preferred first."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    if brotli is not None:
+        encodings.append(BROTLI)
+    encodings.append(GZIP)
+    return encodings
+
+
+def select_encoding(accept_encoding, encodings):
+    """Pick coding from Accept-Encoding header value, coding with the
+    highest quality wins, ties are resolved by order of ``encodings``.
+    None means that response is sent as is.
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in encodings:
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body, encoding, level=None):
+    if level is None:
+        level = DEFAULT_LEVELS[encoding]
+    if encoding == GZIP:
+        # gzip container without file name and timestamp
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush()
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=level)
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError('Unknown content coding: {}'.format(encoding))
+
+
+class Compression:
+    """Compresses responses of the admin application according to
+    Accept-Encoding of the request.
+
+    Bodies shorter than ``min_size`` are sent as is, bodies of at least
+    ``executor_min_size`` bytes are compressed in ``executor``, so event
+    loop keeps serving other requests. ``levels`` overrides default
+    level of a coding, e.g. {'gzip': 9}. Streamed list and export are
+    compressed by aiohttp chunk by chunk, which supports only gzip.
+    """
+
+    def __init__(self, *, min_size=1024, levels=None, encodings=None,
+                 executor_min_size=64 * 1024, executor=None):
+        available = available_encodings()
+        encodings = available if encodings is None else tuple(encodings)
+        not_available = set(encodings).difference(available)
+        if not_available:
+            msg = 'Content codings {} are not available'.format(
+                ', '.join(sorted(not_available)))
+            raise ValueError(msg)
+
+        self._min_size = min_size
+        self._levels = dict(DEFAULT_LEVELS, **(levels or {}))
+        self._encodings = tuple(encodings)
+        self._executor_min_size = executor_min_size
+        self._executor = executor
+
+    @property
+    def encodings(self):
+        return self._encodings
+
+    def setup(self, app):
+        app.middlewares.append(self._middleware())
+
+    def _middleware(self):
+        @web.middleware
+        async def compression_middleware(request, handler):
+            # streamed responses are prepared by handler, they find
+            # compression through request
+            request[COMPRESSION_KEY] = self
+            response = await handler(request)
+            await self.compress_response(request, response)
+            return response
+        return compression_middleware
+
+    async def compress_response(self, request, response):
+        if (not isinstance(response, web.Response) or response.prepared or
+                not self._compressible(response)):
+            return
+        response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+        body = response.body
+        if not isinstance(body, (bytes, bytearray)):
+            return
+        if len(body) < self._min_size:
+            return
+        accept_encoding = request.headers.get(hdrs.ACCEPT_ENCODING, '')
+        encoding = select_encoding(accept_encoding, self._encodings)
+        if encoding is None:
+            return
+
+        level = self._levels[encoding]
+        if len(body) >= self._executor_min_size:
+            loop = _get_running_loop()
+            body = await loop.run_in_executor(self._executor, compress,
+                                              body, encoding, level)
+        else:
+            body = compress(body, encoding, level)
+        response.body = body
+        response.headers[hdrs.CONTENT_ENCODING] = encoding
+        response.headers.pop(hdrs.CONTENT_LENGTH, None)
+
+    def enable_stream_compression(self, request, response):
+        if not self._compressible(response):
+            return
+        response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+        accept_encoding = request.headers.get(hdrs.ACCEPT_ENCODING, '')
+        if GZIP in self._encodings and select_encoding(
+                accept_encoding, (GZIP,)) == GZIP:
+            response.enable_compression(web.ContentCoding.gzip)
+
+    def _compressible(self, response):
+        if hdrs.CONTENT_ENCODING in response.headers:
+            return False
+        return response.content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+def enable_stream_compression(request, response):
+    """Enable compression of streamed response, when admin application
+    compresses responses. Must be called before response is prepared.
+    """
+    compression = request.get(COMPRESSION_KEY)
+    if compression is not None:
+        compression.enable_stream_compression(request, response)
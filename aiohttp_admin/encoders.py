@@ -0,0 +1,224 @@
+"""Encoders of response bodies.
+
+Every encoder turns document into ``bytes`` written to the response
+as is. Standard library encoder produces same output as ``jsonify``,
+orjson and msgspec are used only when installed and handle datetime
+and date natively, their output is compact JSON. MessagePack is sent
+instead of JSON to clients which ask for it, when msgpack is installed.
+"""
+from collections.abc import Mapping
+from datetime import datetime, date, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from aiohttp import hdrs, web
+
+from .exceptions import AdminRESTError, JsonValidationError
+from .utils import jsonify, parse_payload
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+__all__ = ['get_encoder', 'available_encoders', 'encoded_json_response',
+           'JSON_ENCODER', 'ORJSON_ENCODER', 'MSGSPEC_ENCODER',
+           'AUTO_ENCODER', 'JSON_CONTENT_TYPE', 'MSGPACK_CONTENT_TYPE',
+           'OBJECT_ID_EXT', 'select_media_type', 'available_media_types',
+           'dumps_msgpack', 'loads_msgpack', 'negotiated_response',
+           'read_payload']
+
+
+JSON_ENCODER = 'json'
+ORJSON_ENCODER = 'orjson'
+MSGSPEC_ENCODER = 'msgspec'
+# fastest installed encoder
+AUTO_ENCODER = 'auto'
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+# content type used by older msgpack clients
+_MSGPACK_ALIASES = ('application/x-msgpack',)
+
+# msgpack extension type of ObjectId, data is 12 bytes of the id,
+# datetime uses timestamp extension type -1 defined by msgpack spec
+OBJECT_ID_EXT = 1
+
+
+def dumps_json(obj):
+    return jsonify(obj).encode('utf-8')
+
+
+def _default(obj):
+    # datetime and date are handled by encoders themselves
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError('Type not serializable')
+
+
+def dumps_orjson(obj):
+    return orjson.dumps(obj, default=_default)
+
+
+def _msgspec_dumps():
+    return msgspec.json.Encoder(enc_hook=_default).encode
+
+
+def available_encoders():
+    """Names of encoders usable in this environment, fastest first."""
+    names = []
+    if orjson is not None:
+        names.append(ORJSON_ENCODER)
+    if msgspec is not None:
+        names.append(MSGSPEC_ENCODER)
+    names.append(JSON_ENCODER)
+    return names
+
+
+def get_encoder(name=JSON_ENCODER):
+    """Return function which encodes document into JSON bytes."""
+    if name == AUTO_ENCODER:
+        name = available_encoders()[0]
+
+    if name == JSON_ENCODER:
+        return dumps_json
+    if name not in available_encoders():
+        msg = 'JSON encoder {} is not available'.format(name)
+        raise ValueError(msg)
+    if name == ORJSON_ENCODER:
+        return dumps_orjson
+    return _msgspec_dumps()
+
+
+def encoded_json_response(data, *, dumps=dumps_json, status=200,
+                          headers=None):
+    """Same as json_response, but body is produced by encoder returning
+    bytes."""
+    return web.Response(body=dumps(data), status=status, headers=headers,
+                        content_type='application/json', charset='utf-8')
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, ObjectId):
+        return msgpack.ExtType(OBJECT_ID_EXT, obj.binary)
+    if isinstance(obj, datetime):
+        # naive datetimes read from mongo are in UTC
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(obj)
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Mapping):
+        # e.g. RawBSONDocument
+        return dict(obj)
+    raise TypeError('Type not serializable')
+
+
+def _msgpack_ext_hook(code, data):
+    if code == OBJECT_ID_EXT:
+        return ObjectId(data)
+    return msgpack.ExtType(code, data)
+
+
+def dumps_msgpack(obj):
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+
+def loads_msgpack(raw_payload):
+    """Decode MessagePack payload, timestamps are decoded as datetimes
+    in UTC."""
+    try:
+        return msgpack.unpackb(raw_payload, ext_hook=_msgpack_ext_hook,
+                               timestamp=3, raw=False)
+    except (ValueError, TypeError, InvalidId, msgpack.UnpackException):
+        raise JsonValidationError('Payload is not msgpack serialisable')
+
+
+def available_media_types():
+    """Media types of responses, JSON is the default one."""
+    media_types = [JSON_CONTENT_TYPE]
+    if msgpack is not None:
+        media_types.append(MSGPACK_CONTENT_TYPE)
+    return media_types
+
+
+def select_media_type(accept, media_types):
+    """Pick media type from Accept header value. Type with the highest
+    quality wins, type listed explicitly beats one matched by wildcard,
+    remaining ties are resolved by order of ``media_types``. First type
+    is returned when nothing matches, so JSON stays the default.
+    """
+    accepted = {}
+    for item in accept.lower().split(','):
+        media_type, *params = item.split(';')
+        media_type = media_type.strip()
+        if media_type in _MSGPACK_ALIASES:
+            media_type = MSGPACK_CONTENT_TYPE
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_type] = quality
+
+    best, best_rank = media_types[0], (0.0, 0)
+    for media_type in media_types:
+        kind = media_type.split('/')[0] + '/*'
+        for pattern, specificity in ((media_type, 2), (kind, 1),
+                                     ('*/*', 0)):
+            if pattern in accepted:
+                rank = accepted[pattern], specificity
+                break
+        else:
+            continue
+        if rank[0] > 0 and rank > best_rank:
+            best, best_rank = media_type, rank
+    return best
+
+
+def negotiated_response(request, data, *, dumps=dumps_json, status=200,
+                        headers=None):
+    """Response with document encoded as MessagePack when client asks for
+    it with Accept header, otherwise as JSON with ``dumps``."""
+    media_types = available_media_types()
+    media_type = select_media_type(request.headers.get(hdrs.ACCEPT, ''),
+                                   media_types)
+    if media_type == MSGPACK_CONTENT_TYPE:
+        response = web.Response(body=dumps_msgpack(data), status=status,
+                                headers=headers,
+                                content_type=MSGPACK_CONTENT_TYPE)
+    else:
+        response = encoded_json_response(data, dumps=dumps, status=status,
+                                         headers=headers)
+    if len(media_types) > 1:
+        response.headers.add(hdrs.VARY, hdrs.ACCEPT)
+    return response
+
+
+async def read_payload(request):
+    """Read and decode request body according to its Content-Type,
+    MessagePack or JSON."""
+    raw_payload = await request.read()
+    content_type = request.content_type
+    if content_type in (MSGPACK_CONTENT_TYPE,) + _MSGPACK_ALIASES:
+        if msgpack is None:
+            msg = 'msgpack payload is not supported'
+            raise AdminRESTError(msg, status_code=415)
+        return loads_msgpack(raw_payload)
+    return parse_payload(raw_payload)
@@ -14,6 +14,8 @@ class AdminRESTError(web.HTTPError):
         super().__init__(reason=message)
         if not message:
             message = self.error
+        self.message = message
+        self.details = kwargs
 
         msg_dict = {"error": message}
 
@@ -1,14 +1,54 @@
 from abc import abstractmethod, ABCMeta
+from collections import namedtuple
+from types import MappingProxyType
 
+import bson
 from bson import ObjectId
 from bson.errors import InvalidId
+from bson.son import SON
 
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
 
-from .backends.mongo_utils import create_filter
-from .exceptions import ObjectNotFound
+from .backends.mongo_loader import DetailLoader
+from .backends.mongo_raw import raw_codec_options
+from .backends.mongo_utils import (create_filter, encode_cursor,
+                                   decode_cursor, keyset_filter, compile_plan)
+from .encoders import JSON_ENCODER
+from .exceptions import ObjectNotFound, JsonValidationError, AdminRESTError
 from .security import Permissions, require
-from .utils import json_response, validate_query, calc_pagination, ASC
+from .utils import (json_response, validate_query, calc_pagination, ASC,
+                    gather_or_cancel, EXACT_COUNT, ESTIMATED_COUNT,
+                    CAPPED_COUNT, NO_COUNT)
+
+
+OFFSET_PAGINATION = 'offset'
+KEYSET_PAGINATION = 'keyset'
+
+# page rows and total count fetched by two concurrent queries or
+# by single aggregation with $facet stage
+CONCURRENT_LIST = 'concurrent'
+FACET_LIST = 'facet'
+
+# q filter is searched by prefix regex over every string column or
+# by $text query when collection has text index
+REGEX_SEARCH = 'regex'
+TEXT_SEARCH = 'text'
+
+# what create_, update_ and delete_ return: whole document, only primary
+# key or nothing, every policy costs single round trip
+FULL_RETURN = 'full'
+ID_ONLY_RETURN = 'id_only'
+NO_RETURN = 'none'
+
+# count is None when it is not calculated and string like '1000+'
+# for capped count, has_more is reported only when count is not calculated
+ListPage = namedtuple('ListPage', ['entities', 'count', 'next_cursor',
+                                   'prev_cursor', 'has_more'])
+
+ListParams = namedtuple('ListParams', ['paging', 'query', 'position',
+                                       'projection', 'sort', 'skip', 'limit',
+                                       'keyset', 'count_mode', 'count_key'])
 
 
 class AbstractResource(metaclass=ABCMeta):
@@ -21,10 +61,19 @@ class AbstractResource(metaclass=ABCMeta):
         self.actions = {
             # 'action': ['METHOD', '/{entity_id}'],
             'list': ['GET', ''],
+            'export': ['GET', '/export'],
+            'many': ['GET', '/many'],
             'detail': ['GET', '/{entity_id}'],
             'create': ['POST', ''],
+            'bulk_create': ['POST', '/bulk'],
+            'bulk_update': ['PUT', '/bulk'],
+            'bulk_delete': ['DELETE', '/bulk'],
             'update': ['PUT', '/{entity_id}'],
+            'patch': ['PATCH', '/{entity_id}'],
             'delete': ['DELETE', '/{entity_id}'],
+            'add_items': ['POST', '/{entity_id}/{field}'],
+            'remove_item': ['DELETE', '/{entity_id}/{field}/{value}'],
+            'array_length': ['GET', '/{entity_id}/{field}/length'],
         }
 
     @property
@@ -67,6 +116,45 @@ class AbstractResource(metaclass=ABCMeta):
         assert entity_id
         return json_response({})
 
+    async def patch(self, request):  # pragma: no cover
+        # await require(request, Permissions.edit)
+        raise AdminRESTError('Patch is not supported', status_code=501)
+
+    async def add_items(self, request):  # pragma: no cover
+        # await require(request, Permissions.edit)
+        raise AdminRESTError('Array operations are not supported',
+                             status_code=501)
+
+    async def remove_item(self, request):  # pragma: no cover
+        # await require(request, Permissions.edit)
+        raise AdminRESTError('Array operations are not supported',
+                             status_code=501)
+
+    async def array_length(self, request):  # pragma: no cover
+        # await require(request, Permissions.view)
+        raise AdminRESTError('Array operations are not supported',
+                             status_code=501)
+
+    async def export(self, request):  # pragma: no cover
+        # await require(request, Permissions.view)
+        raise AdminRESTError('Export is not supported', status_code=501)
+
+    async def many(self, request):  # pragma: no cover
+        # await require(request, Permissions.view)
+        raise AdminRESTError('Get many is not supported', status_code=501)
+
+    async def bulk_create(self, request):  # pragma: no cover
+        # await require(request, Permissions.add)
+        raise AdminRESTError('Bulk create is not supported', status_code=501)
+
+    async def bulk_update(self, request):  # pragma: no cover
+        # await require(request, Permissions.edit)
+        raise AdminRESTError('Bulk update is not supported', status_code=501)
+
+    async def bulk_delete(self, request):  # pragma: no cover
+        # await require(request, Permissions.delete)
+        raise AdminRESTError('Bulk delete is not supported', status_code=501)
+
     def enable(self, action, method='GET', path=''):
         self.actions.update({action: [method, path]})
 
@@ -85,63 +173,740 @@ class AbstractResource(metaclass=ABCMeta):
         # add_route('PUT', url_id, self.update)
         # add_route('DELETE', url_id, self.delete)
 
-        for action, arg in self.actions.items():
+        # routes are matched in order of registration, so plain paths
+        # like /export are added before /{entity_id}
+        actions = sorted(self.actions.items(), key=lambda a: '{' in a[1][1])
+        for action, arg in actions:
             add_route(arg[0], url + arg[1], self.__getattribute__(action))
 
 
 class ActionResource:
+    # offset pagination is default, keyset pagination returns cursors
+    # so deep pages cost the same as first one
+    pagination = OFFSET_PAGINATION
+    list_strategy = CONCURRENT_LIST
+    count_mode = EXACT_COUNT
+    # capped count stops counting after this number of rows
+    count_cap = 1000
+    # optional CountCache shared between resources
+    count_cache = None
+    # list is streamed from cursor in batches, so memory depends on
+    # batch size instead of page size, keyset paged lists are streamed
+    # only with _stream, as streamed list has no page cursors
+    stream_list = False
+    stream_batch_size = 500
+    # export reads the whole filtered collection, large batches save
+    # round trips, number of exported rows is capped
+    export_batch_size = 5000
+    export_max_rows = 100000
+    # relations expanded by _expand argument, declared as mapping of
+    # field to "collection.label_field", e.g. {'author_id': 'user.username'}
+    relations = None
+    # concurrent detail lookups are sent as single $in query, lookups
+    # are collected during one loop iteration or detail_loader_window
+    # seconds
+    detail_loader = False
+    detail_loader_window = 0
+    # full document created or updated is built without extra query,
+    # id_only and none also skip transfer of the document
+    return_policy = FULL_RETURN
+    # detail returns at most this number of elements of every list
+    # field, the rest is paged with _slice, sliced fields are listed in
+    # X-Sliced-Fields header. PUT of a document read by detail writes
+    # the sliced arrays back, so it drops the rest of their elements,
+    # list fields of capped resource are changed with add_items and
+    # remove_item instead
+    array_slice_cap = None
+    # max number of ids in single get many request
+    many_max_ids = 1000
+    # max number of documents in single bulk request
+    bulk_max_items = 1000
+    # optional SingleFlight, identical list and detail queries running
+    # at the same time share one round trip to the server
+    single_flight = None
+    # optional FilterCache of compiled _filters shared between resources
+    filter_cache = None
+    # text search falls back to regex when text index is missing, rows
+    # found by text search are sorted by relevance unless _sortField
+    # is given, sort by textScore requires MongoDB 4.4
+    text_search = REGEX_SEARCH
+    text_score_sort = False
+    # encoder of JSON responses: json, orjson, msgspec or auto, which
+    # picks the fastest installed one
+    json_encoder = JSON_ENCODER
+    # list and detail documents are read as raw BSON and converted to
+    # JSON without decoding into dicts, _expand is not supported,
+    # detail_loader is not used and json_encoder must be json
+    raw_bson = False
+    # result of text index check, None until checked
+    _text_index = None
+    # QueryPlan compiled from schema at setup time
+    _plan = None
+    # compiled relations, field name to (collection name, label field)
+    _relations = MappingProxyType({})
+    _loader = None
+    _raw_collection = None
+
     def __int__(self, collection, primary_key='_id', **kwargs):
         self._collection = collection
         self._primary_key = primary_key
 
-    async def list_(self, q, schema):
-        paging = calc_pagination(q, self._primary_key)
-        filters = q.get('_filters')
-        query = {}
-        if filters:
-            query = create_filter(filters, schema)
-        projection = [k.name for k in schema.keys]
-
-        sort_direction = ASCENDING if paging.sort_dir == ASC else DESCENDING
+    async def list_(self, q, schema, query=None):
+        params = self._list_params(q, schema, query=query)
+        cursor = self._list_cursor(params)
+
+        count = self._cached_count(params)
+        use_facet = (self.list_strategy == FACET_LIST and
+                     params.count_mode != ESTIMATED_COUNT)
+        if params.count_mode == NO_COUNT or count is not None:
+            entities = await cursor.to_list(params.limit)
+        elif use_facet:
+            entities, count = await self._facet_find(params)
+        else:
+            entities, count = await gather_or_cancel(
+                cursor.to_list(params.limit),
+                self._total(params))
+
+        paging = params.paging
+        next_cursor = prev_cursor = has_more = None
+        if params.keyset:
+            entities, next_cursor, prev_cursor = self._keyset_cursors(
+                entities, paging)
+            if params.count_mode == NO_COUNT:
+                has_more = next_cursor is not None
+        elif params.count_mode == NO_COUNT:
+            has_more = len(entities) > paging.limit
+            entities = entities[:paging.limit]
+        await self._expand(entities, q.get('_expand', ()))
+        return ListPage(entities, count, next_cursor, prev_cursor, has_more)
+
+    async def stream_list_(self, q, schema, batch_size, query=None):
+        """Return not consumed cursor of the list page and total count,
+        documents are fetched from server in batches of ``batch_size``.
+        """
+        params = self._list_params(q, schema, query=query, stream=True)
+        cursor = self._list_cursor(params).batch_size(batch_size)
+
+        count = self._cached_count(params)
+        if params.count_mode != NO_COUNT and count is None:
+            count = await self._total(params)
+        return cursor, count
+
+    def export_(self, q, schema, query=None):
+        """Return not consumed cursor over filtered collection, limited
+        by ``export_max_rows``."""
+        plan = self._plan_for(schema)
+        if query is None:
+            query = self._filter_query(q, schema, plan)
+        projection = q.get('_fields') or plan.fields
+        sort_field = q.get('_sortField', self._primary_key)
+        sort_direction = ASCENDING if q['_sortDir'] == ASC else DESCENDING
+        limit = min(q.get('_limit', self.export_max_rows),
+                    self.export_max_rows)
 
         cursor = (self._collection.find(query, projection=projection)
-                  .skip(paging.offset)
-                  .limit(paging.limit)
-                  .sort(paging.sort_field, sort_direction))
-
-        entities = await cursor.to_list(paging.limit)
-        count = await self._collection.count_documents(query)
-        return entities, count
-
-    async def detail_(self, entity_id):
+                  .sort(sort_field, sort_direction)
+                  .limit(limit)
+                  .batch_size(self.export_batch_size))
+        return cursor
+
+    def _plan_for(self, schema):
+        plan = self._plan
+        if plan is None or plan.schema is not schema:
+            plan = compile_plan(schema)
+        return plan
+
+    def _filter_query(self, q, schema, plan):
+        filters = q.get('_filters')
+        if not filters:
+            return {}
+        return create_filter(filters, schema, plan,
+                             text_index=self._use_text_index())
+
+    def _use_text_index(self):
+        return self.text_search == TEXT_SEARCH and bool(self._text_index)
+
+    def _list_params(self, q, schema, query=None, stream=False):
+        if stream and q.get('_expand'):
+            msg = '_expand can not be used for streamed list'
+            raise JsonValidationError(msg)
+        self._check_raw_expand(q.get('_expand'))
+        # query is mongo query compiled from _filters in advance,
+        # otherwise it is created from validated q
+        paging = calc_pagination(q, self._primary_key)
+        plan = self._plan_for(schema)
+        if query is None:
+            query = self._filter_query(q, schema, plan)
+        projection, keyset = self._list_projection(q, plan, paging)
+        count_mode = q.get('_count', self.count_mode)
+
+        if keyset and not stream:
+            position, sort, skip, limit = self._keyset_params(paging)
+        elif keyset:
+            # streamed rows can not be reversed, so only forward cursor
+            # is supported and page cursors are not reported
+            if paging.before is not None:
+                msg = '_before cursor can not be used for streamed list'
+                raise JsonValidationError(msg)
+            position, sort, skip, limit = self._keyset_params(paging)
+            limit = paging.limit
+            keyset = False
+        else:
+            sort_direction = (ASCENDING if paging.sort_dir == ASC
+                              else DESCENDING)
+            position = None
+            sort = [(paging.sort_field, sort_direction)]
+            if (self.text_score_sort and '$text' in query and
+                    '_sortField' not in q):
+                sort.insert(0, ('score', {'$meta': 'textScore'}))
+            skip, limit = paging.offset, paging.limit
+            if count_mode == NO_COUNT and not stream:
+                # fetch one extra row to find out if there is one more page
+                limit += 1
+
+        count_key = None
+        if self.count_cache is not None and count_mode != NO_COUNT:
+            count_key = self.count_cache.key(self._resource_name, count_mode,
+                                             query)
+        return ListParams(paging, query, position, projection, sort, skip,
+                          limit, keyset, count_mode, count_key)
+
+    def _list_projection(self, q, plan, paging):
+        projection = self._expand_projection(
+            q.get('_fields') or plan.fields, q.get('_expand'))
+        keyset = (self.pagination == KEYSET_PAGINATION or
+                  paging.after is not None or paging.before is not None)
+        if keyset and paging.sort_field not in projection:
+            # page cursors are built from value of the sort field
+            projection = tuple(projection) + (paging.sort_field,)
+        return projection, keyset
+
+    def _list_columns(self, q, schema):
+        """Fields of columnar list page: primary key and every projected
+        field in schema order, labels of relations go to the last
+        column."""
+        plan = self._plan_for(schema)
+        paging = calc_pagination(q, self._primary_key)
+        projection, _ = self._list_projection(q, plan, paging)
+        # primary key is returned even when it is not in _fields
+        selected = set(projection) | {self._primary_key}
+        columns = [f for f in plan.fields if f in selected]
+        if self._primary_key not in columns:
+            columns.insert(0, self._primary_key)
+        if q.get('_expand'):
+            columns.append('_expanded')
+        return columns
+
+    def _list_cursor(self, params):
+        query, position = params.query, params.position
+        if position is not None:
+            query = {'$and': [query, position]} if query else position
+
+        collection = self._read_collection()
+        cursor = (collection.find(query, projection=params.projection)
+                  .skip(params.skip)
+                  .limit(params.limit)
+                  .sort(params.sort))
+        return cursor
+
+    def _read_collection(self):
+        if not self.raw_bson:
+            return self._collection
+        if self._raw_collection is None:
+            codec_options = raw_codec_options(self._collection.codec_options)
+            self._raw_collection = self._collection.with_options(
+                codec_options=codec_options)
+        return self._raw_collection
+
+    def _check_raw_expand(self, expand):
+        # raw documents are read only, so labels can not be added
+        if self.raw_bson and expand:
+            msg = '_expand can not be used for raw BSON resource'
+            raise JsonValidationError(msg)
+
+    def _cached_count(self, params):
+        if params.count_key is None:
+            return None
+        return self.count_cache.get(params.count_key)
+
+    def _invalidate_caches(self):
+        if self.count_cache is not None:
+            self.count_cache.invalidate(self._resource_name)
+        if self.single_flight is not None:
+            self.single_flight.invalidate(self._resource_name)
+
+    async def _total(self, params):
+        count = await self._count(params.query, params.count_mode)
+        if params.count_key is not None:
+            self.count_cache.set(params.count_key, count)
+        return count
+
+    async def _count(self, query, count_mode):
+        if count_mode == ESTIMATED_COUNT and not query:
+            # uses collection metadata, but can not be applied to filters
+            return await self._collection.estimated_document_count()
+
+        if count_mode == CAPPED_COUNT:
+            count = await self._collection.count_documents(
+                query, limit=self.count_cap + 1)
+            return self._capped_count(count)
+
+        return await self._collection.count_documents(query)
+
+    def _capped_count(self, count):
+        if count > self.count_cap:
+            return '{}+'.format(self.count_cap)
+        return count
+
+    async def _facet_find(self, params):
+        # whole $facet result is single document, so it is subject to
+        # 16MB document size limit
+        position = params.position
+        rows = [] if position is None else [{'$match': position}]
+        rows.append({'$sort': SON(params.sort)})
+        if params.skip:
+            rows.append({'$skip': params.skip})
+        rows.append({'$limit': params.limit})
+        rows.append({'$project': {f: 1 for f in params.projection}})
+
+        total = [{'$count': 'count'}]
+        if params.count_mode == CAPPED_COUNT:
+            total.insert(0, {'$limit': self.count_cap + 1})
+
+        query = params.query
+        pipeline = [{'$match': query}] if query else []
+        pipeline.append({'$facet': {'rows': rows, 'total': total}})
+
+        cursor = self._read_collection().aggregate(pipeline)
+        result = (await cursor.to_list(1))[0]
+        total = result['total']
+        count = total[0]['count'] if total else 0
+        if params.count_mode == CAPPED_COUNT:
+            count = self._capped_count(count)
+        if params.count_key is not None:
+            self.count_cache.set(params.count_key, count)
+        return result['rows'], count
+
+    def _keyset_params(self, paging):
+        pk = self._primary_key
+        token = paging.after or paging.before or None
+        backward = paging.before is not None
+        sort_dir = paging.sort_dir
+
+        position = None
+        if token is not None:
+            value, key = decode_cursor(token, paging.sort_field, sort_dir)
+            position = keyset_filter(value, key, paging.sort_field, sort_dir,
+                                     pk, backward=backward)
+
+        forward = (sort_dir == ASC) != backward
+        direction = ASCENDING if forward else DESCENDING
+        sort = [(paging.sort_field, direction)]
+        if paging.sort_field != pk:
+            sort.append((pk, direction))
+
+        # fetch one extra row to find out if there is one more page
+        skip = paging.offset if token is None else 0
+        return position, sort, skip, paging.limit + 1
+
+    def _keyset_cursors(self, entities, paging):
+        token = paging.after or paging.before or None
+        backward = paging.before is not None
+
+        has_more = len(entities) > paging.limit
+        entities = entities[:paging.limit]
+        if backward:
+            entities.reverse()
+
+        if not entities:
+            return entities, None, None
+
+        if backward:
+            has_next, has_prev = token is not None, has_more
+        else:
+            has_next = has_more
+            has_prev = token is not None or paging.offset > 0
+
+        def cursor_for(doc):
+            return encode_cursor(doc, paging.sort_field, paging.sort_dir,
+                                 self._primary_key)
+
+        next_cursor = cursor_for(entities[-1]) if has_next else None
+        prev_cursor = cursor_for(entities[0]) if has_prev else None
+        return entities, next_cursor, prev_cursor
+
+    def _expand_projection(self, projection, expand):
+        # expanded fields are fetched even when not listed in _fields
+        if projection is None or not expand:
+            return projection
+        missing = tuple(f for f in expand if f not in projection)
+        if not missing:
+            return projection
+        if isinstance(projection, dict):
+            if 1 not in projection.values():
+                # projection of slices only returns all fields
+                return projection
+            projection = dict(projection)
+            projection.update((f, 1) for f in missing)
+            return projection
+        return tuple(projection) + missing
+
+    def _array_slices(self, projection, slices):
+        """Return (start, count) of every list field sliced in detail,
+        fields requested in _slice and list fields capped by
+        array_slice_cap."""
+        array_fields = self._plan.array_traf_map if self._plan else {}
+        slices = dict(slices or {})
+        not_valid = set(slices).difference(array_fields)
+        if not_valid:
+            msg = 'Fields: {} are not list fields of resource'.format(
+                ', '.join(sorted(not_valid)))
+            raise JsonValidationError(msg)
+
+        cap = self.array_slice_cap
+        if cap is not None:
+            for field in array_fields:
+                if projection is None or field in projection:
+                    start, count = slices.get(field, (0, cap))
+                    slices[field] = (start, min(count, cap))
+        return slices
+
+    def _slice_projection(self, projection, slices):
+        """Add $slice of list fields to projection, list fields are
+        capped by array_slice_cap."""
+        slices = self._array_slices(projection, slices)
+        if not slices:
+            return projection
+
+        # inclusion of other fields is kept, slice only projection
+        # returns all fields
+        result = {f: 1 for f in projection or ()}
+        for field, (start, count) in slices.items():
+            result[field] = {'$slice': [start, count]}
+        return result
+
+    async def _expand(self, entities, expand):
+        """Add labels of related documents to entities under _expanded
+        key, each relation is resolved with single $in query."""
+        if not expand or not entities:
+            return entities
+        coros = [self._expand_relation(entities, field) for field in expand]
+        await gather_or_cancel(*coros)
+        return entities
+
+    async def _expand_relation(self, entities, field):
+        collection_name, label = self._relations[field]
+
+        def ids(value):
+            # relation field holds single id or list of ids
+            return value if isinstance(value, list) else [value]
+
+        values = {v for e in entities for v in ids(e.get(field))
+                  if v is not None}
+        labels = {}
+        if values:
+            collection = self._collection.database[collection_name]
+            cursor = collection.find({'_id': {'$in': list(values)}},
+                                     projection=[label])
+            labels = {doc['_id']: doc.get(label)
+                      for doc in await cursor.to_list(None)}
+
+        for entity in entities:
+            value = entity.get(field)
+            if isinstance(value, list):
+                expanded = [labels.get(v) for v in value]
+            else:
+                expanded = labels.get(value)
+            entity.setdefault('_expanded', {})[field] = expanded
+
+    def _detail_loader(self):
+        if self._loader is None:
+            self._loader = DetailLoader(self._collection, self._primary_key,
+                                        window=self.detail_loader_window)
+        return self._loader
+
+    async def detail_(self, entity_id, projection=None, expand=(),
+                      slices=None):
         try:
             query = {self._primary_key: ObjectId(entity_id)}
         except InvalidId:
             msg = 'Entity with id: {} not found'.format(entity_id)
             raise ObjectNotFound(msg)
 
-        doc = await self._collection.find_one(query)
-        if not doc:
+        self._check_raw_expand(expand)
+        projection = self._slice_projection(projection, slices)
+        projection = self._expand_projection(projection, expand)
+        # loader batches only plain field projections
+        if (self.detail_loader and not self.raw_bson and
+                not isinstance(projection, dict)):
+            doc = await self._detail_loader().load(query[self._primary_key],
+                                                   projection=projection)
+        else:
+            doc = await self._read_collection().find_one(
+                query, projection=projection)
+        # len() of RawBSONDocument decodes it
+        if doc is None:
             msg = 'Entity with id: {} not found'.format(entity_id)
             raise ObjectNotFound(msg)
 
+        await self._expand([doc], expand)
         return doc
 
+    async def many_(self, entity_ids, projection=None, expand=()):
+        """Fetch entities by ids with single $in query, entities are
+        returned in order of ids together with list of ids not found."""
+        if len(entity_ids) > self.many_max_ids:
+            msg = 'Too many ids, at most {} are allowed'.format(
+                self.many_max_ids)
+            raise JsonValidationError(msg)
+
+        # duplicated ids are fetched and returned once
+        object_ids = {}
+        for entity_id in entity_ids:
+            try:
+                object_ids.setdefault(entity_id, ObjectId(entity_id))
+            except InvalidId:
+                object_ids.setdefault(entity_id, None)
+
+        pk = self._primary_key
+        projection = self._expand_projection(projection, expand)
+        if projection and pk not in projection:
+            projection = tuple(projection) + (pk,)
+        values = [v for v in object_ids.values() if v is not None]
+        docs = {}
+        if values:
+            query = {pk: {'$in': values}}
+            cursor = self._collection.find(query, projection=projection)
+            docs = {doc[pk]: doc for doc in await cursor.to_list(None)}
+
+        entities, missing = [], []
+        for entity_id, value in object_ids.items():
+            doc = docs.get(value)
+            if doc is None:
+                missing.append(entity_id)
+            else:
+                entities.append(doc)
+        await self._expand(entities, expand)
+        return entities, missing
+
     async def create_(self, data):
         result = await self._collection.insert_one(data)
-        query = {self._primary_key: result.inserted_id}
-        doc = await self._collection.find_one(query)
+        self._invalidate_caches()
+        return self._returned(result.inserted_id, data)
+
+    def _returned(self, object_id, data=None):
+        if self.return_policy == NO_RETURN:
+            return None
+        doc = {self._primary_key: object_id}
+        if self.return_policy == FULL_RETURN:
+            # document is not read back, it goes through BSON in memory
+            # instead, so datetimes are naive UTC truncated to
+            # milliseconds as they are stored
+            doc.update(data)
+            doc = bson.decode(bson.encode(doc),
+                              codec_options=self._collection.codec_options)
         return doc
 
+    async def bulk_create_(self, docs):
+        """Insert documents with single unordered insert_many, failed
+        documents do not stop the rest.
+
+        :returns: list of results in order of docs, {pk: id} for
+            inserted document and dict with error otherwise
+        """
+        errors = {}
+        try:
+            await self._collection.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            for error in exc.details['writeErrors']:
+                errors[error['index']] = {
+                    'error': error['errmsg'],
+                    'error_details': {'code': error['code']}}
+        finally:
+            self._invalidate_caches()
+
+        # insert_many sets _id of every document before write
+        results = []
+        for i, doc in enumerate(docs):
+            result = errors.get(i) or {self._primary_key: doc['_id']}
+            results.append(result)
+        return results
+
+    def _ids_query(self, entity_ids):
+        # not valid ids can not match any document, so they are skipped
+        object_ids = []
+        for entity_id in entity_ids:
+            try:
+                object_ids.append(ObjectId(entity_id))
+            except InvalidId:
+                pass
+        return {self._primary_key: {'$in': object_ids}}
+
+    async def bulk_update_(self, query, data, dry_run=False):
+        """Set same fields of all documents matched by query with single
+        update_many, dry run only counts matched documents."""
+        if dry_run:
+            matched = await self._collection.count_documents(query)
+            return {'matched': matched}
+
+        try:
+            result = await self._collection.update_many(query,
+                                                        {'$set': data})
+        except WriteError as exc:
+            raise self._write_stopped(exc)
+        finally:
+            self._invalidate_caches()
+        return {'matched': result.matched_count,
+                'modified': result.modified_count}
+
+    async def bulk_update_each_(self, updates, dry_run=False):
+        """Set different fields of every document with single unordered
+        bulk_write, updates is list of (entity_id, data) pairs. Failed
+        updates do not stop the rest, they are reported under errors
+        key together with id of the document.
+        """
+        pk = self._primary_key
+        entity_ids, object_ids, requests = [], [], []
+        for entity_id, data in updates:
+            try:
+                object_id = ObjectId(entity_id)
+            except InvalidId:
+                continue
+            entity_ids.append(entity_id)
+            object_ids.append(object_id)
+            requests.append(UpdateOne({pk: object_id}, {'$set': data}))
+
+        if dry_run:
+            query = {pk: {'$in': object_ids}}
+            matched = await self._collection.count_documents(query)
+            return {'matched': matched}
+        if not requests:
+            return {'matched': 0, 'modified': 0}
+
+        try:
+            result = await self._collection.bulk_write(requests,
+                                                       ordered=False)
+        except BulkWriteError as exc:
+            # writes which did not fail are applied anyway
+            errors = [{'id': entity_ids[error['index']],
+                       'error': error['errmsg'],
+                       'error_details': {'code': error['code']}}
+                      for error in exc.details['writeErrors']]
+            return {'matched': exc.details['nMatched'],
+                    'modified': exc.details['nModified'],
+                    'errors': errors}
+        finally:
+            self._invalidate_caches()
+        return {'matched': result.matched_count,
+                'modified': result.modified_count}
+
+    async def bulk_delete_(self, query, dry_run=False):
+        """Delete all documents matched by query with single delete_many,
+        dry run only counts matched documents."""
+        if dry_run:
+            matched = await self._collection.count_documents(query)
+            return {'matched': matched}
+
+        try:
+            result = await self._collection.delete_many(query)
+        except WriteError as exc:
+            raise self._write_stopped(exc)
+        finally:
+            self._invalidate_caches()
+        # every matched document is deleted
+        return {'matched': result.deleted_count,
+                'deleted': result.deleted_count}
+
+    def _write_stopped(self, exc):
+        # update_many and delete_many stop at first error and report no
+        # counts, documents before the failed one are written already
+        msg = 'Write stopped by error, some documents may be written'
+        details = exc.details or {}
+        return AdminRESTError(msg, status_code=409,
+                              reason=details.get('errmsg', str(exc)),
+                              code=exc.code)
+
     async def update_(self, entity_id, data):
+        return await self._update_one(entity_id, {"$set": data})
+
+    async def patch_(self, entity_id, data, unset=()):
+        """Set only supplied fields and remove fields listed in unset."""
+        update = {}
+        if data:
+            update["$set"] = data
+        if unset:
+            update["$unset"] = {field: "" for field in unset}
+        return await self._update_one(entity_id, update)
+
+    async def array_length_(self, entity_id, field):
+        """Return number of elements of list field computed by server
+        with $size, array itself is not transferred."""
+        try:
+            query = {self._primary_key: ObjectId(entity_id)}
+        except InvalidId:
+            msg = 'Entity with id: {} not found'.format(entity_id)
+            raise ObjectNotFound(msg)
+
+        pipeline = [
+            {'$match': query},
+            {'$project': {
+                'length': {'$size': {'$ifNull': ['$' + field, []]}}}},
+        ]
+        docs = await self._collection.aggregate(pipeline).to_list(1)
+        if not docs:
+            msg = 'Entity with id: {} not found'.format(entity_id)
+            raise ObjectNotFound(msg)
+        return docs[0]['length']
+
+    async def add_items_(self, entity_id, field, values):
+        """Add values missing in array field with $addToSet, only
+        values are sent, not the whole array.
+
+        :returns: True when document was modified
+        """
+        update = {'$addToSet': {field: {'$each': values}}}
+        return await self._update_array(entity_id, update)
+
+    async def remove_item_(self, entity_id, field, value):
+        """Remove all occurrences of value from array field with $pull.
+
+        :returns: True when document was modified
+        """
+        return await self._update_array(entity_id, {'$pull': {field: value}})
+
+    async def _update_array(self, entity_id, update):
+        try:
+            query = {self._primary_key: ObjectId(entity_id)}
+        except InvalidId:
+            msg = 'Entity with id: {} not found'.format(entity_id)
+            raise ObjectNotFound(msg)
+
+        result = await self._collection.update_one(query, update)
+        self._invalidate_caches()
+        if not result.matched_count:
+            msg = 'Entity with id: {} not found'.format(entity_id)
+            raise ObjectNotFound(msg)
+        return result.modified_count > 0
+
+    async def _update_one(self, entity_id, update):
         try:
             query = {self._primary_key: ObjectId(entity_id)}
         except InvalidId:
             msg = 'Entity with id: {} not found'.format(entity_id)
             raise ObjectNotFound(msg)
 
-        doc = await self._collection.find_one_and_update(query, {"$set": data}, upsert=False, new=True)
-        if not doc:
+        if self.return_policy == FULL_RETURN:
+            doc = await self._collection.find_one_and_update(
+                query, update, upsert=False,
+                return_document=ReturnDocument.AFTER)
+            found = doc is not None
+        else:
+            result = await self._collection.update_one(
+                query, update, upsert=False)
+            found = result.matched_count > 0
+            doc = self._returned(query[self._primary_key])
+        self._invalidate_caches()
+        if not found:
             msg = 'Entity with id: {} not found'.format(entity_id)
             raise ObjectNotFound(msg)
 
@@ -154,8 +919,15 @@ class ActionResource:
             msg = 'Entity with id: {} not found'.format(entity_id)
             raise ObjectNotFound(msg)
 
-        doc = await self._collection.find_one_and_delete(query)
-        if not doc:
+        if self.return_policy == FULL_RETURN:
+            doc = await self._collection.find_one_and_delete(query)
+            found = doc is not None
+        else:
+            result = await self._collection.delete_one(query)
+            found = result.deleted_count > 0
+            doc = self._returned(query[self._primary_key])
+        self._invalidate_caches()
+        if not found:
             msg = 'Entity with id: {} not found'.format(entity_id)
             raise ObjectNotFound(msg)
         return doc
@@ -1,3 +1,6 @@
+import asyncio
+import csv
+import io
 import json
 from bson import ObjectId
 
@@ -9,12 +12,19 @@ from types import MappingProxyType
 import trafaret as t
 from aiohttp import web
 
+from .compression import enable_stream_compression
 from .exceptions import JsonValidationError
 
-__all__ = ['json_response', 'jsonify', 'validate_query', 'validate_payload', 'calc_pagination', 'ASC', 'LoginForm', 'MULTI_FIELD_TEXT_QUERY', 'as_dict']
+__all__ = ['json_response', 'jsonify', 'validate_query', 'validate_payload',
+           'calc_pagination', 'ASC', 'LoginForm', 'MULTI_FIELD_TEXT_QUERY',
+           'as_dict', 'gather_or_cancel', 'stream_json_response',
+           'stream_csv_response', 'ListQuery', 'ExportQuery', 'DetailQuery',
+           'ManyQuery', 'BulkQuery', 'validate_filters', 'validate_bulk_data',
+           'parse_payload', 'validate_data', 'columnar', 'list_separator']
 
 
-PagingParams = namedtuple('PagingParams', ['limit', 'offset', 'sort_field', 'sort_dir'])
+PagingParams = namedtuple('PagingParams', ['limit', 'offset', 'sort_field',
+                                           'sort_dir', 'after', 'before'])
 MULTI_FIELD_TEXT_QUERY = 'q'
 
 
@@ -36,9 +46,132 @@ jsonify = partial(json.dumps, default=json_datetime_serial)
 json_response = partial(web.json_response, dumps=jsonify)
 
 
+def list_separator(dumps):
+    """Bytes which ``dumps`` writes between elements of list, ', ' for
+    ``jsonify`` and ',' for compact encoders."""
+    encoded = dumps([0, 0])
+    if isinstance(encoded, str):
+        encoded = encoded.encode('utf-8')
+    return encoded[2:-2]
+
+
+async def stream_json_response(request, docs, *, headers=None,
+                               ndjson=False, batch_size=500, dumps=jsonify):
+    """Write documents from async iterable as JSON array (or newline
+    delimited JSON) while they are fetched. Each chunk of ``batch_size``
+    documents waits for transport to drain, so slow client does not make
+    server buffer the whole result. ``dumps`` may return either str or
+    bytes, array is written with its separator, so body is the same as
+    ``dumps`` produces for the whole list.
+    """
+    response = web.StreamResponse(headers=headers)
+    response.content_type = ('application/x-ndjson' if ndjson
+                             else 'application/json')
+    response.charset = 'utf-8'
+    enable_stream_compression(request, response)
+    await response.prepare(request)
+    separator = list_separator(dumps)
+
+    def encode(chunk, first):
+        if ndjson:
+            return b''.join(line + b'\n' for line in chunk)
+        return (b'[' if first else separator) + separator.join(chunk)
+
+    chunk, first = [], True
+    async for doc in docs:
+        encoded = dumps(doc)
+        if isinstance(encoded, str):
+            encoded = encoded.encode('utf-8')
+        chunk.append(encoded)
+        if len(chunk) >= batch_size:
+            await response.write(encode(chunk, first))
+            chunk, first = [], False
+
+    tail = encode(chunk, first) if chunk else b''
+    if not ndjson:
+        tail += b'[]' if first and not chunk else b']'
+    await response.write(tail)
+    await response.write_eof()
+    return response
+
+
+def columnar(docs, fields):
+    """Convert documents into {"fields": [...], "rows": [[...], ...]},
+    so field names are sent once per page. Values missing in document
+    are null."""
+    return {
+        'fields': list(fields),
+        'rows': [[doc.get(f) for f in fields] for doc in docs],
+    }
+
+
+def csv_value(value):
+    """Format value of document field for CSV cell, nested values
+    are written as JSON"""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return jsonify(value)
+    if isinstance(value, (datetime, date, ObjectId)):
+        return json_datetime_serial(value)
+    return value
+
+
+async def stream_csv_response(request, docs, fields, *, headers=None,
+                              batch_size=500):
+    """Write documents from async iterable as CSV with header row,
+    each chunk of ``batch_size`` rows waits for transport to drain.
+    """
+    response = web.StreamResponse(headers=headers)
+    response.content_type = 'text/csv'
+    response.charset = 'utf-8'
+    enable_stream_compression(request, response)
+    await response.prepare(request)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    rows = 0
+    async for doc in docs:
+        writer.writerow([csv_value(doc.get(f)) for f in fields])
+        rows += 1
+        if rows % batch_size == 0:
+            await response.write(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+
+    await response.write(buffer.getvalue().encode('utf-8'))
+    await response.write_eof()
+    return response
+
+
 OptKey = partial(t.Key, optional=True)
 
 
+# comma separated list of field names, like _fields=title,views
+FieldList = t.String & (
+    lambda value: [f.strip() for f in value.split(',') if f.strip()])
+
+
+def _parse_slices(value):
+    # field:start:count[,field:start:count], start may be negative
+    slices = {}
+    for part in value.split(','):
+        try:
+            field, start, count = part.strip().split(':')
+            start, count = int(start), int(count)
+        except ValueError:
+            msg = 'slice should be field:start:count, got {}'.format(part)
+            return t.DataError(msg)
+        if count < 1:
+            return t.DataError('slice count should be positive')
+        slices[field] = (start, count)
+    return slices
+
+
+# array slices of detail, like _slice=whom_id:0:100
+SliceList = t.String & _parse_slices
+
 SimpleType = t.Int | t.Bool | t.String | t.Float
 Filter = t.Dict({
     OptKey('in'): t.List(SimpleType),
@@ -52,29 +185,87 @@ Filter = t.Dict({
 })
 
 
+Filters = t.Mapping(t.String, Filter | SimpleType)
+
+
 ASC = 'ASC'
 DESC = 'DESC'
 
+# how total number of rows is reported for list requests
+EXACT_COUNT = 'exact'
+ESTIMATED_COUNT = 'estimated'
+CAPPED_COUNT = 'capped'
+NO_COUNT = 'none'
+
+JSON_FORMAT = 'json'
+NDJSON_FORMAT = 'ndjson'
+CSV_FORMAT = 'csv'
+# list page as field names and rows of values
+COLUMNAR_FORMAT = 'columnar'
+
 
 ListQuery = t.Dict({
-    OptKey('_page', default=1): t.Int[1:],
-    OptKey('_perPage', default=30): t.Int[1:],
+    OptKey('_page', default=1): t.ToInt[1:],
+    OptKey('_perPage', default=30): t.ToInt[1:],
+    OptKey('_sortField'): t.String,
+    OptKey('_sortDir', default=DESC): t.Enum(DESC, ASC),
+    # opaque keyset cursors, used instead of _page, blank cursor
+    # starts keyset pagination from the first (or last) page
+    OptKey('_after'): t.String(allow_blank=True),
+    OptKey('_before'): t.String(allow_blank=True),
+    OptKey('_count'): t.Enum(EXACT_COUNT, ESTIMATED_COUNT, CAPPED_COUNT,
+                             NO_COUNT),
+    OptKey('_format'): t.Enum(JSON_FORMAT, NDJSON_FORMAT, COLUMNAR_FORMAT),
+    OptKey('_stream'): t.ToBool,
+    OptKey('_fields'): FieldList,
+    OptKey('_expand'): FieldList,
+
+    OptKey('_filters'): Filters
+})
+
+ExportQuery = t.Dict({
+    OptKey('format', default=CSV_FORMAT): t.Enum(CSV_FORMAT, NDJSON_FORMAT),
     OptKey('_sortField'): t.String,
     OptKey('_sortDir', default=DESC): t.Enum(DESC, ASC),
+    OptKey('_limit'): t.ToInt[1:],
+    OptKey('_fields'): FieldList,
 
-    OptKey('_filters'): t.Mapping(t.String, Filter | SimpleType)
+    OptKey('_filters'): Filters
 })
 
+# other query arguments of detail request are ignored
+DetailQuery = t.Dict({
+    OptKey('_fields'): FieldList,
+    OptKey('_expand'): FieldList,
+    OptKey('_slice'): SliceList,
+}).ignore_extra('*')
+
+# comma separated ids of entities fetched by single request
+ManyQuery = t.Dict({
+    t.Key('ids'): FieldList,
+    OptKey('_fields'): FieldList,
+    OptKey('_expand'): FieldList,
+}).ignore_extra('*')
+
+# rows of bulk update and delete are selected by ids or by _filters
+BulkQuery = t.Dict({
+    OptKey('ids'): FieldList,
+    OptKey('_dryRun', default=False): t.ToBool,
+
+    OptKey('_filters'): Filters
+}).ignore_extra('*')
+
 LoginForm = t.Dict({
     "username": t.String,
     "password": t.String,
 })
 
 
-def validate_query_structure(query):
+def validate_query_structure(query, trafaret=ListQuery):
     """Validate query arguments in list request.
 
     :param query: mapping with pagination and filtering information
+    :param trafaret: validator of the query, ListQuery by default
     """
     query_dict = dict(query)
     filters = query_dict.pop('_filters', None)
@@ -87,21 +278,53 @@ def validate_query_structure(query):
         else:
             query_dict['_filters'] = f
     try:
-        q = ListQuery(query_dict)
+        q = trafaret(query_dict)
     except t.DataError as exc:
-        msg = '_filters query invalid'
-        raise JsonValidationError(msg, **as_dict(exc))
+        details = as_dict(exc)
+        if '_filters' in details:
+            msg = '_filters query invalid'
+        else:
+            msg = 'Query arguments invalid: {}'.format(
+                ', '.join(sorted(details)))
+        raise JsonValidationError(msg, **details)
 
     return q
 
 
-def validate_payload(raw_payload, schema):
+def validate_filters(raw_filters, possible_columns):
+    """Parse and validate raw _filters argument of list request, errors
+    are same as reported by validate_query.
+    """
+    try:
+        f = json.loads(raw_filters)
+    except ValueError:
+        msg = '_filters field can not be serialized'
+        raise JsonValidationError(msg)
+
+    try:
+        filters = Filters(f)
+    except t.DataError as exc:
+        msg = '_filters query invalid'
+        raise JsonValidationError(msg, _filters=exc.as_dict())
+
+    not_valid = set(filters).difference(possible_columns)
+    not_valid.discard(MULTI_FIELD_TEXT_QUERY)
+    if not_valid:
+        column_list = ', '.join(not_valid)
+        msg = 'Columns: {} do not present in resource'.format(column_list)
+        raise JsonValidationError(msg)
+    return filters
+
+
+def parse_payload(raw_payload):
     payload = raw_payload.decode(encoding='UTF-8')
     try:
-        parsed = json.loads(payload)
+        return json.loads(payload)
     except ValueError:
         raise JsonValidationError('Payload is not json serialisable')
 
+
+def validate_data(parsed, schema):
     try:
         data = schema(parsed)
     except t.DataError as exc:
@@ -109,8 +332,37 @@ def validate_payload(raw_payload, schema):
     return data
 
 
-def validate_query(query, possible_columns):
-    q = validate_query_structure(query)
+def validate_payload(raw_payload, schema):
+    parsed = parse_payload(raw_payload)
+    return validate_data(parsed, schema)
+
+
+def validate_bulk_data(parsed, schema, max_items):
+    """Validate array of documents, every element is validated
+    separately.
+
+    :returns: list of (data, error) pairs in order of elements, error
+        is same dict as reported for single invalid payload
+    """
+    if not isinstance(parsed, list) or not parsed:
+        raise JsonValidationError('Payload should be non empty json array')
+    if len(parsed) > max_items:
+        msg = 'Too many items, at most {} are allowed'.format(max_items)
+        raise JsonValidationError(msg)
+
+    items = []
+    for element in parsed:
+        try:
+            items.append((schema(element), None))
+        except t.DataError as exc:
+            error = {'error': JsonValidationError.error,
+                     'error_details': as_dict(exc)}
+            items.append((None, error))
+    return items
+
+
+def validate_query(query, possible_columns, trafaret=ListQuery):
+    q = validate_query_structure(query, trafaret)
     sort_field = q.get('_sortField')
 
     filters = q.get('_filters', [])
@@ -119,12 +371,18 @@ def validate_query(query, possible_columns):
     if sort_field is not None:
         columns.append(sort_field)
 
-    not_valid = set(columns).difference(
-        possible_columns + [MULTI_FIELD_TEXT_QUERY])
+    # possible_columns can be any collection, set is the fastest one
+    not_valid = set(columns).difference(possible_columns)
+    not_valid.discard(MULTI_FIELD_TEXT_QUERY)
+    not_valid.update(set(q.get('_fields', ())).difference(possible_columns))
     if not_valid:
         column_list = ', '.join(not_valid)
         msg = 'Columns: {} do not present in resource'.format(column_list)
         raise JsonValidationError(msg)
+
+    if '_after' in q and '_before' in q:
+        msg = 'Only one of _after and _before cursors can be supplied'
+        raise JsonValidationError(msg)
     return MappingProxyType(q)
 
 
@@ -136,7 +394,9 @@ def calc_pagination(query_dict, default_sort_direction):
     sort_dir = q['_sortDir']
     offset = (page - 1) * per_page
     limit = per_page
-    return PagingParams(limit, offset, sort_field, sort_dir)
+    after = q.get('_after')
+    before = q.get('_before')
+    return PagingParams(limit, offset, sort_field, sort_dir, after, before)
 
 
 def as_dict(exc, value=None):
@@ -144,3 +404,23 @@ def as_dict(exc, value=None):
     if isinstance(result, str):
         return {"error": result}
     return result
+
+
+async def gather_or_cancel(*coros):
+    """Run coroutines concurrently and return their results in order,
+    if one of them fails rest are cancelled and exception is raised.
+    """
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
@@ -0,0 +1,41 @@
+"""Time to encode list page of 1000 documents with every available JSON
+encoder, documents hold ObjectId and datetime values as read from mongo.
+
+    $ PYTHONPATH=. python benchmarks/bench_json_encoders.py
+"""
+import datetime
+import timeit
+
+from bson import ObjectId
+
+from aiohttp_admin.encoders import get_encoder, available_encoders
+
+
+def make_page(size=1000):
+    published_at = datetime.datetime(2016, 2, 27, 22, 33, 4)
+    return [{'_id': ObjectId(),
+             'title': 'title {}'.format(i),
+             'category': 'category field',
+             'body': 'body field ' * 20,
+             'views': i,
+             'average_note': i * 0.1,
+             'published_at': published_at + datetime.timedelta(hours=i),
+             'status': 'c',
+             'visible': bool(i % 2),
+             'tags': ['tag {}'.format(j) for j in range(5)]}
+            for i in range(size)]
+
+
+def main():
+    page = make_page()
+    number = 50
+    for name in available_encoders():
+        dumps = get_encoder(name)
+        total = min(timeit.repeat(lambda: dumps(page), number=number,
+                                  repeat=5))
+        print('{:<10} {:8.2f} ms per page {:8d} bytes'.format(
+            name, total / number * 1e3, len(dumps(page))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Time and peak memory to write list page of 1000 documents as JSON,
+from documents decoded into dicts and from raw BSON documents.
+
+    $ PYTHONPATH=. python benchmarks/bench_raw_bson.py
+"""
+import timeit
+import tracemalloc
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from aiohttp_admin.backends.mongo_raw import dumps_raw
+from aiohttp_admin.utils import jsonify
+
+from bench_json_encoders import make_page
+
+
+raws = [bson.encode(doc) for doc in make_page()]
+
+
+def decoded():
+    # what driver and jsonify do for plain resource
+    return jsonify([bson.decode(raw) for raw in raws]).encode('utf-8')
+
+
+def raw_bson():
+    return dumps_raw([RawBSONDocument(raw) for raw in raws])
+
+
+def main():
+    assert decoded() == raw_bson()
+    number = 20
+    for func in (decoded, raw_bson):
+        total = min(timeit.repeat(func, number=number, repeat=5))
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('{:<10} {:8.2f} ms per page {:8d} KiB peak'.format(
+            func.__name__, total / number * 1e3, peak // 1024))
+
+
+if __name__ == '__main__':
+    main()
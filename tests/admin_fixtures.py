@@ -47,11 +47,15 @@ def mysql_admin_creator(loop, create_app_and_client, mysql, sa_table,
 @pytest.fixture
 def mongo_admin_creator(loop, create_app_and_client, mongo_collection,
                         document_schema, create_document):
-    async def mongo_admin(resource_name='test_post', security=setup_security):
+    async def mongo_admin(resource_name='test_post', security=setup_security,
+                          schema=None, compression=None, **resource_options):
         app, client, app_starter = await create_app_and_client()
         m = mongo_collection
-        resources = (MotorResource(m, document_schema, url=resource_name),)
-        admin = aiohttp_admin.setup(app, '/', resources=resources)
+        schema = document_schema if schema is None else schema
+        resources = (MotorResource(m, schema, url=resource_name,
+                                   **resource_options),)
+        admin = aiohttp_admin.setup(app, '/', resources=resources,
+                                    compression=compression)
         security(admin)
         app.add_subapp('/admin', admin)
         await app_starter()
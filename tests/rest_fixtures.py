@@ -105,7 +105,8 @@ class AdminRESTClient:
         return answer
 
     async def list(self, resource, page=1, per_page=30, sort_field=None,
-                   sort_dir=None, filters=None, **kw):
+                   sort_dir=None, filters=None, columnar=False, params=None,
+                   **kw):
         url = '{}/{}'.format(self._admin_prefix, resource)
         f = json.dumps(filters or {})
 
@@ -113,11 +114,21 @@ class AdminRESTClient:
 
         sort_field and query.update({'_sortField': sort_field})
         sort_dir and query.update({'_sortDir': sort_dir})
+        columnar and query.update({'_format': 'columnar'})
+        params and query.update(params)
 
         resp = await self.request("GET", url, params=query, **kw)
         answer = await self.handle_response(resp)
+        if columnar:
+            return self.decode_columnar(answer)
         return answer
 
+    @staticmethod
+    def decode_columnar(answer):
+        """Convert columnar list page back to list of documents"""
+        fields = answer['fields']
+        return [dict(zip(fields, row)) for row in answer['rows']]
+
     async def update(self, resource, entity_id, data, **kw):
         path = '{}/{}/{}'.format(self._admin_prefix, resource, entity_id)
         resp = await self.request("PUT", path, data=data, **kw)
@@ -0,0 +1,210 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from aiohttp_admin.cache import (LRUCache, CountCache, FilterCache,
+                                 SingleFlight)
+from aiohttp_admin.exceptions import JsonValidationError, ObjectNotFound
+
+
+class Timer:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    # b is least recently used one
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_ttl():
+    timer = Timer()
+    cache = LRUCache(maxsize=2, ttl=10, timer=timer)
+    cache.set('a', 1)
+    timer.now = 9
+    assert cache.get('a') == 1
+    timer.now = 10
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_stats():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+    stats = cache.stats
+    assert stats.hits == 1
+    assert stats.misses == 1
+    assert stats.size == 1
+    assert stats.maxsize == 2
+
+
+def test_count_cache_normalized_query():
+    cache = CountCache()
+    oid = ObjectId('1' * 24)
+    key = cache.key('posts', 'exact', {'views': {'$gt': 1}, '_id': oid})
+    cache.set(key, 42)
+
+    key = cache.key('posts', 'exact', {'_id': oid, 'views': {'$gt': 1}})
+    assert cache.get(key) == 42
+
+    key = cache.key('posts', 'exact', {'_id': oid, 'views': {'$gt': 1.0}})
+    assert cache.get(key) is None
+
+    key = cache.key('posts', 'capped', {'_id': oid, 'views': {'$gt': 1}})
+    assert cache.get(key) is None
+
+    key = cache.key('comments', 'exact', {'_id': oid, 'views': {'$gt': 1}})
+    assert cache.get(key) is None
+
+
+def test_count_cache_invalidate():
+    cache = CountCache()
+    key = cache.key('posts', 'exact', {})
+    cache.set(key, 42)
+    other_key = cache.key('comments', 'exact', {})
+    cache.set(other_key, 7)
+
+    cache.invalidate('posts')
+    assert cache.get(cache.key('posts', 'exact', {})) is None
+    assert cache.get(cache.key('comments', 'exact', {})) == 7
+
+    # count calculated before invalidation is not visible
+    cache.set(key, 42)
+    assert cache.get(cache.key('posts', 'exact', {})) is None
+
+
+def test_filter_cache():
+    cache = FilterCache(maxsize=2)
+    calls = []
+
+    def compile(raw):
+        calls.append(raw)
+        return {'views': int(raw)}
+
+    assert cache.get_or_compile('posts', '1', compile) == {'views': 1}
+    assert cache.get_or_compile('posts', '1', compile) == {'views': 1}
+    assert cache.get_or_compile('comments', '1', compile) == {'views': 1}
+    assert calls == ['1', '1']
+    assert cache.stats.hits == 1
+
+
+def test_filter_cache_returns_copy():
+    cache = FilterCache()
+
+    def compile(raw):
+        return {'$or': [{'views': {'$gt': int(raw)}}]}
+
+    query = cache.get_or_compile('posts', '1', compile)
+    query['$or'][0]['views']['$lt'] = 5
+    query['title'] = 'foo'
+    assert cache.get_or_compile('posts', '1', compile) == compile('1')
+
+
+def test_filter_cache_variant():
+    cache = FilterCache()
+
+    def compile_regex(raw):
+        return {'$or': [{'title': {'$regex': raw}}]}
+
+    def compile_text(raw):
+        return {'$text': {'$search': raw}}
+
+    regex = cache.get_or_compile('posts', 'foo', compile_regex,
+                                 variant='regex')
+    text = cache.get_or_compile('posts', 'foo', compile_text,
+                                variant='text')
+    assert regex == compile_regex('foo')
+    assert text == compile_text('foo')
+
+
+def test_filter_cache_error():
+    cache = FilterCache()
+    calls = []
+
+    def compile(raw):
+        calls.append(raw)
+        raise JsonValidationError('_filters query invalid', _filters='bad')
+
+    errors = []
+    for _ in range(2):
+        with pytest.raises(JsonValidationError) as ctx:
+            cache.get_or_compile('posts', 'bad', compile)
+        errors.append(ctx.value)
+
+    assert calls == ['bad']
+    assert errors[0] is not errors[1]
+    assert errors[1].message == '_filters query invalid'
+    assert errors[1].details == {'_filters': 'bad'}
+
+
+@pytest.mark.run_loop
+async def test_single_flight(loop):
+    flight = SingleFlight()
+    calls = []
+
+    async def query():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'count': len(calls)}
+
+    key = flight.key('posts', 'list', {'_page': 1}, {'views': 1})
+    same_key = flight.key('posts', 'list', {'_page': 1}, {'views': 1})
+    other_key = flight.key('posts', 'list', {'_page': 2}, {'views': 1})
+    assert key == same_key
+
+    results = await asyncio.gather(flight.do(key, query),
+                                   flight.do(same_key, query),
+                                   flight.do(other_key, query))
+    assert len(calls) == 2
+    assert results[0] is results[1]
+    assert flight.coalesced == 1
+    assert len(flight) == 0
+
+    # finished calls are not reused
+    await flight.do(key, query)
+    assert len(calls) == 3
+
+
+@pytest.mark.run_loop
+async def test_single_flight_invalidate(loop):
+    flight = SingleFlight()
+    key = flight.key('posts', 'detail', '1')
+    flight.invalidate('posts')
+    assert flight.key('posts', 'detail', '1') != key
+    assert flight.key('comments', 'detail', '1') == (
+        flight.key('comments', 'detail', '1'))
+
+
+@pytest.mark.run_loop
+async def test_single_flight_error(loop):
+    flight = SingleFlight()
+
+    async def query():
+        await asyncio.sleep(0.01)
+        raise ObjectNotFound('Entity with id: 1 not found')
+
+    key = flight.key('posts', 'detail', '1')
+    results = await asyncio.gather(flight.do(key, query),
+                                   flight.do(key, query),
+                                   return_exceptions=True)
+    assert all(isinstance(r, ObjectNotFound) for r in results)
+    # error is a response, so every caller gets own instance
+    assert results[0] is not results[1]
+    assert results[1].status_code == 404
+    assert results[1].message == 'Entity with id: 1 not found'
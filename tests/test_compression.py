@@ -0,0 +1,82 @@
+import zlib
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from aiohttp_admin.compression import (Compression, select_encoding,
+                                       compress, available_encodings)
+
+
+def test_select_encoding():
+    encodings = ('zstd', 'br', 'gzip')
+    assert select_encoding('gzip, deflate', encodings) == 'gzip'
+    assert select_encoding('gzip, br', encodings) == 'br'
+    assert select_encoding('gzip;q=1.0, br;q=0.5', encodings) == 'gzip'
+    assert select_encoding('GZIP', encodings) == 'gzip'
+    assert select_encoding('*', encodings) == 'zstd'
+    assert select_encoding('*, zstd;q=0', encodings) == 'br'
+    assert select_encoding('gzip;q=0', encodings) is None
+    assert select_encoding('identity', encodings) is None
+    assert select_encoding('', encodings) is None
+
+
+def test_compress_gzip():
+    body = b'{"foo": "bar"}' * 100
+    compressed = compress(body, 'gzip', level=9)
+    assert zlib.decompress(compressed, 16 + zlib.MAX_WBITS) == body
+    assert len(compressed) < len(body)
+
+
+@pytest.mark.parametrize('encoding, module', [('br', 'brotli'),
+                                              ('zstd', 'zstandard')])
+def test_compress_optional(encoding, module):
+    pytest.importorskip(module)
+    assert encoding in available_encodings()
+    assert compress(b'foo' * 100, encoding)
+
+
+def test_compression_unknown_encoding():
+    with pytest.raises(ValueError):
+        Compression(encodings=['gzip', 'lzma'])
+
+
+@pytest.mark.run_loop
+async def test_compress_response(loop):
+    compression = Compression(min_size=100, encodings=['gzip'],
+                              executor_min_size=1000)
+    headers = {'Accept-Encoding': 'gzip, deflate'}
+
+    for size in (500, 5000):
+        body = b'{"foo": "bar"}' * size
+        request = make_mocked_request('GET', '/', headers=headers)
+        response = web.Response(body=body, content_type='application/json')
+        await compression.compress_response(request, response)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert zlib.decompress(response.body, 16 + zlib.MAX_WBITS) == body
+
+    # small body
+    request = make_mocked_request('GET', '/', headers=headers)
+    response = web.Response(body=b'{}', content_type='application/json')
+    await compression.compress_response(request, response)
+    assert 'Content-Encoding' not in response.headers
+
+    # coding not accepted
+    request = make_mocked_request('GET', '/', headers={})
+    response = web.Response(body=body, content_type='application/json')
+    await compression.compress_response(request, response)
+    assert 'Content-Encoding' not in response.headers
+    assert response.body == body
+
+    # msgpack is compressed as JSON is
+    request = make_mocked_request('GET', '/', headers=headers)
+    response = web.Response(body=body, content_type='application/msgpack')
+    await compression.compress_response(request, response)
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    # content which is not compressible
+    request = make_mocked_request('GET', '/', headers=headers)
+    response = web.Response(body=body, content_type='image/png')
+    await compression.compress_response(request, response)
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,111 @@
+import datetime
+import json
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+from bson import ObjectId
+
+from aiohttp_admin import encoders
+from aiohttp_admin.encoders import (get_encoder, available_encoders,
+                                    encoded_json_response, select_media_type,
+                                    dumps_msgpack, loads_msgpack,
+                                    negotiated_response, read_payload)
+from aiohttp_admin.exceptions import AdminRESTError, JsonValidationError
+from aiohttp_admin.utils import jsonify, list_separator
+
+
+DOC = {'_id': ObjectId('1' * 24),
+       'title': 'foo',
+       'published_at': datetime.datetime(2016, 2, 27, 22, 33, 4),
+       'day': datetime.date(2016, 2, 27),
+       'tags': ['a', 'b']}
+
+
+def test_json_encoder_same_as_jsonify():
+    dumps = get_encoder('json')
+    assert dumps({'foo': 'bar'}) == b'{"foo": "bar"}'
+    assert dumps(DOC) == jsonify(DOC).encode('utf-8')
+
+
+@pytest.mark.parametrize('name', ['orjson', 'msgspec'])
+def test_fast_encoders(name):
+    pytest.importorskip(name)
+    dumps = get_encoder(name)
+    encoded = dumps(DOC)
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded.decode('utf-8')) == json.loads(jsonify(DOC))
+    # streamed lists are joined with it
+    assert list_separator(dumps) == b','
+
+    with pytest.raises(TypeError):
+        dumps(object())
+
+
+def test_auto_encoder():
+    fastest = get_encoder(available_encoders()[0])
+    assert get_encoder('auto')(DOC) == fastest(DOC)
+    assert available_encoders()[-1] == 'json'
+
+
+def test_unknown_encoder():
+    with pytest.raises(ValueError):
+        get_encoder('pickle')
+
+
+def test_encoded_json_response():
+    response = encoded_json_response({'foo': 'bar'}, status=201,
+                                     headers={'X-Total-Count': '1'})
+    assert response.status == 201
+    assert response.body == b'{"foo": "bar"}'
+    assert response.content_type == 'application/json'
+    assert response.charset == 'utf-8'
+    assert response.headers['X-Total-Count'] == '1'
+
+
+def test_select_media_type():
+    media_types = ['application/json', 'application/msgpack']
+    assert select_media_type('', media_types) == 'application/json'
+    assert select_media_type('*/*', media_types) == 'application/json'
+    assert (select_media_type('application/msgpack', media_types) ==
+            'application/msgpack')
+    assert (select_media_type('application/x-msgpack', media_types) ==
+            'application/msgpack')
+    assert (select_media_type('application/msgpack, */*;q=0.9',
+                              media_types) == 'application/msgpack')
+    assert (select_media_type('application/msgpack, */*', media_types) ==
+            'application/msgpack')
+    assert (select_media_type('application/json, application/msgpack;q=0.5',
+                              media_types) == 'application/json')
+    # msgpack is not installed
+    assert (select_media_type('application/msgpack', media_types[:1]) ==
+            'application/json')
+
+
+def test_msgpack_round_trip():
+    pytest.importorskip('msgpack')
+    doc = loads_msgpack(dumps_msgpack(DOC))
+    assert doc['_id'] == DOC['_id']
+    assert doc['published_at'] == DOC['published_at'].replace(
+        tzinfo=datetime.timezone.utc)
+    assert doc['day'] == '2016-02-27'
+    assert doc['tags'] == ['a', 'b']
+
+    with pytest.raises(JsonValidationError):
+        loads_msgpack(b'\xc1')
+
+
+@pytest.mark.run_loop
+async def test_msgpack_not_installed(loop, monkeypatch):
+    monkeypatch.setattr(encoders, 'msgpack', None)
+
+    headers = {'Accept': 'application/msgpack'}
+    request = make_mocked_request('GET', '/', headers=headers)
+    response = negotiated_response(request, {'foo': 'bar'})
+    assert response.content_type == 'application/json'
+    assert 'Vary' not in response.headers
+
+    headers = {'Content-Type': 'application/msgpack'}
+    request = make_mocked_request('POST', '/', headers=headers)
+    with pytest.raises(AdminRESTError) as ctx:
+        await read_payload(request)
+    assert ctx.value.status == 415
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from aiohttp_admin.backends.mongo_loader import DetailLoader
+
+
+class Cursor:
+
+    def __init__(self, docs):
+        self._docs = docs
+
+    async def to_list(self, length):
+        return self._docs
+
+
+class Collection:
+    """Collection which records queries and matches only $in of _id"""
+
+    def __init__(self, docs, error=None):
+        self.docs = docs
+        self.queries = []
+        self.error = error
+
+    def find(self, query, projection=None):
+        self.queries.append((query, projection))
+        if self.error is not None:
+            raise self.error
+        ids = query['_id']['$in']
+        return Cursor([dict(d) for d in self.docs if d['_id'] in ids])
+
+
+@pytest.mark.run_loop
+async def test_detail_loader_batches(loop):
+    collection = Collection([{'_id': i, 'title': str(i)} for i in range(5)])
+    loader = DetailLoader(collection)
+
+    ids = [3, 1, 7, 3]
+    docs = await asyncio.gather(*[loader.load(i) for i in ids])
+    assert docs == [{'_id': 3, 'title': '3'}, {'_id': 1, 'title': '1'},
+                    None, {'_id': 3, 'title': '3'}]
+    # every caller gets own copy of the same document
+    assert docs[0] is not docs[3]
+    assert len(collection.queries) == 1
+    query, _ = collection.queries[0]
+    assert sorted(query['_id']['$in']) == [1, 3, 7]
+
+    # next loop iteration starts new batch
+    assert await loader.load(2) == {'_id': 2, 'title': '2'}
+    assert len(collection.queries) == 2
+
+
+@pytest.mark.run_loop
+async def test_detail_loader_projection_and_batch_size(loop):
+    collection = Collection([{'_id': i, 'title': str(i)} for i in range(5)])
+    loader = DetailLoader(collection, max_batch_size=2, window=0.01)
+
+    coros = [loader.load(0), loader.load(1), loader.load(2),
+             loader.load(3, projection=['title'])]
+    docs = await asyncio.gather(*coros)
+    assert [d['_id'] for d in docs] == [0, 1, 2, 3]
+    projections = [p for _, p in collection.queries]
+    assert projections.count(None) == 2
+    assert ('title',) in projections
+
+
+@pytest.mark.run_loop
+async def test_detail_loader_error(loop):
+    collection = Collection([], error=ValueError('boom'))
+    loader = DetailLoader(collection)
+
+    coros = [loader.load(1), loader.load(2), loader.load(2)]
+    results = await asyncio.gather(*coros, return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+    assert all(r.args == ('boom',) for r in results)
+    # callers do not share exception and its traceback
+    assert len({id(r) for r in results}) == 3
+
+
+@pytest.mark.run_loop
+async def test_detail_loader_keeps_tasks(loop):
+    released = asyncio.Event()
+
+    class WaitingCursor(Cursor):
+
+        async def to_list(self, length):
+            await released.wait()
+            return self._docs
+
+    class WaitingCollection(Collection):
+
+        def find(self, query, projection=None):
+            return WaitingCursor(super().find(query, projection)._docs)
+
+    loader = DetailLoader(WaitingCollection([{'_id': 1}]))
+    future = asyncio.ensure_future(loader.load(1))
+    while not loader._tasks:
+        await asyncio.sleep(0)
+    # running fetch is referenced by loader until it finishes
+    released.set()
+    assert await future == {'_id': 1}
+    await asyncio.sleep(0)
+    assert not loader._tasks
@@ -0,0 +1,88 @@
+import datetime
+import json
+from functools import partial
+
+import bson
+import pytest
+import trafaret as t
+from bson import ObjectId, Decimal128, Int64
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from aiohttp_admin.backends.mongo import MotorResource
+from aiohttp_admin.backends.mongo_raw import (raw_to_json, dumps_raw,
+                                              decode_raw,
+                                              raw_codec_options)
+from aiohttp_admin.utils import jsonify
+
+
+DOC = {'_id': ObjectId('1' * 24),
+       'title': 'h\xe9llo "quoted"\n☃',
+       'views': -5,
+       'big': Int64(2 ** 40),
+       'average_note': 0.1,
+       'nan': float('nan'),
+       'inf': float('-inf'),
+       'visible': True,
+       'deleted': None,
+       'published_at': datetime.datetime(2016, 2, 27, 22, 33, 4, 123000),
+       'before_epoch': datetime.datetime(1969, 12, 31, 23, 59, 59, 1000),
+       'author': {'name': 'foo', 'tags': [1, {'x': []}, {}]},
+       'empty': []}
+
+
+def test_raw_to_json_same_as_jsonify():
+    raw = bson.encode(DOC)
+    assert raw_to_json(raw) == jsonify(bson.decode(raw))
+    assert raw_to_json(bson.encode({})) == '{}'
+
+
+def test_raw_to_json_tz_aware():
+    tz = datetime.timezone(datetime.timedelta(hours=3))
+    codec_options = CodecOptions(tz_aware=True, tzinfo=tz)
+    raw = bson.encode(DOC)
+    expected = jsonify(bson.decode(raw, codec_options=codec_options))
+    assert raw_to_json(raw, codec_options) == expected
+    assert '+03:00' in expected
+
+
+def test_raw_to_json_decodes_unsupported_types():
+    raw = bson.encode({'_id': 1, 'price': Decimal128('1.5')})
+    with pytest.raises(TypeError):
+        raw_to_json(raw)
+
+
+def test_dumps_raw():
+    docs = [RawBSONDocument(bson.encode(dict(DOC, views=i)))
+            for i in range(3)]
+    decoded = [bson.decode(doc.raw) for doc in docs]
+    assert dumps_raw(docs) == jsonify(decoded).encode('utf-8')
+    assert dumps_raw(docs[0]) == jsonify(decoded[0]).encode('utf-8')
+    assert dumps_raw([]) == b'[]'
+    assert dumps_raw({'status': 'deleted'}) == b'{"status": "deleted"}'
+
+    # list separator is taken from encoder, as for streamed list
+    compact = partial(json.dumps, separators=(',', ':'))
+    encoded = b','.join(dumps_raw(doc) for doc in docs)
+    assert dumps_raw(docs, dumps=compact) == b'[' + encoded + b']'
+
+
+def test_raw_codec_options():
+    codec_options = raw_codec_options(CodecOptions(tz_aware=True))
+    assert codec_options.document_class is RawBSONDocument
+    assert codec_options.tz_aware
+
+
+def test_decode_raw():
+    docs = [RawBSONDocument(bson.encode(DOC))]
+    decoded = decode_raw(docs)
+    assert type(decoded[0]) is dict
+    assert type(decoded[0]['author']) is dict
+    assert jsonify(decoded[0]) == raw_to_json(docs[0].raw)
+
+
+def test_raw_bson_requires_json_encoder():
+    schema = t.Dict({t.Key('_id'): t.String, t.Key('title'): t.String})
+    with pytest.raises(ValueError):
+        MotorResource(None, schema, url='posts', raw_bson=True,
+                      json_encoder='auto')
@@ -0,0 +1,220 @@
+import base64
+import datetime
+
+import pytest
+import trafaret as t
+from bson import ObjectId
+from trafaret.contrib.object_id import MongoId
+
+from aiohttp_admin.exceptions import JsonValidationError
+from aiohttp_admin.backends.mongo_utils import (encode_cursor, decode_cursor,
+                                                keyset_filter, compile_plan,
+                                                create_filter, compile_filters,
+                                                has_text_index,
+                                                compile_relations,
+                                                create_partial_validator,
+                                                merge_patch,
+                                                validate_array_value)
+
+
+@pytest.fixture
+def schema():
+    return t.Dict({
+        t.Key('_id'): MongoId,
+        t.Key('title'): t.String(max_length=200),
+        t.Key('body'): t.String,
+        t.Key('views'): t.ToInt,
+    })
+
+
+def test_cursor_round_trip():
+    doc = {'_id': ObjectId('1' * 24),
+           'published_at': datetime.datetime(2016, 2, 27, 22, 33, 4)}
+    token = encode_cursor(doc, 'published_at', 'DESC', '_id')
+    value, key = decode_cursor(token, 'published_at', 'DESC')
+    assert value == doc['published_at']
+    assert key == doc['_id']
+
+
+def test_cursor_sort_mismatch():
+    doc = {'_id': ObjectId('1' * 24), 'views': 42}
+    token = encode_cursor(doc, 'views', 'DESC', '_id')
+
+    with pytest.raises(JsonValidationError):
+        decode_cursor(token, 'views', 'ASC')
+
+    with pytest.raises(JsonValidationError):
+        decode_cursor(token, 'title', 'DESC')
+
+
+def test_cursor_not_valid():
+    with pytest.raises(JsonValidationError):
+        decode_cursor('foo', 'views', 'DESC')
+
+    # tampered cursor with malformed ObjectId
+    raw = b'{"f": "views", "d": "DESC", "v": 1, "k": {"$oid": "xx"}}'
+    token = base64.urlsafe_b64encode(raw).decode('ascii')
+    with pytest.raises(JsonValidationError):
+        decode_cursor(token, 'views', 'DESC')
+
+
+def test_keyset_filter():
+    key = ObjectId('1' * 24)
+    query = keyset_filter(42, key, 'views', 'ASC', '_id')
+    expected = {'$or': [{'views': {'$gt': 42}},
+                        {'views': 42, '_id': {'$gt': key}}]}
+    assert query == expected
+
+    # rows with null or missing value sort before 42
+    query = keyset_filter(42, key, 'views', 'ASC', '_id', backward=True)
+    expected = {'$or': [{'views': {'$lt': 42}},
+                        {'views': 42, '_id': {'$lt': key}},
+                        {'views': None}]}
+    assert query == expected
+
+    query = keyset_filter(key, key, '_id', 'DESC', '_id')
+    assert query == {'_id': {'$lt': key}}
+
+
+def test_keyset_filter_null_value():
+    key = ObjectId('1' * 24)
+    query = keyset_filter(None, key, 'views', 'ASC', '_id')
+    expected = {'$or': [{'views': None, '_id': {'$gt': key}},
+                        {'views': {'$ne': None}}]}
+    assert query == expected
+
+    query = keyset_filter(None, key, 'views', 'DESC', '_id')
+    assert query == {'views': None, '_id': {'$lt': key}}
+
+    query = keyset_filter(42, key, 'views', 'DESC', '_id')
+    expected = {'$or': [{'views': {'$lt': 42}},
+                        {'views': 42, '_id': {'$lt': key}},
+                        {'views': None}]}
+    assert query == expected
+
+
+def test_compile_plan(schema):
+    plan = compile_plan(schema)
+    assert plan.schema is schema
+    assert set(plan.fields) == {'_id', 'title', 'body', 'views'}
+    assert plan.field_set == frozenset(plan.fields)
+    assert set(plan.string_columns) == {'title', 'body'}
+
+    with pytest.raises(TypeError):
+        plan.column_traf_map['foo'] = t.Int
+    assert plan.array_traf_map == {}
+
+
+def test_compile_plan_array_fields():
+    schema = t.Dict({
+        t.Key('_id'): MongoId,
+        t.Key('whom_id'): t.List(MongoId()),
+    })
+    plan = compile_plan(schema)
+    assert set(plan.array_traf_map) == {'whom_id'}
+    oid = plan.array_traf_map['whom_id']('1' * 24)
+    assert oid == ObjectId('1' * 24)
+
+
+def test_create_filter_with_plan(schema):
+    plan = compile_plan(schema)
+    filters = {'views': {'gt': 1}, 'q': 'foo'}
+    query = create_filter(filters, schema, plan)
+    assert query == create_filter(filters, schema)
+    assert query['views'] == {'$gt': 1}
+    assert len(query['$or']) == 2
+
+
+def test_compile_filters(schema):
+    query = compile_filters('{"views": {"in": [1, 2]}}', schema)
+    assert query == {'views': {'$in': [1, 2]}}
+    # plain dicts, lookup of missing key does not insert it
+    assert type(query) is dict and type(query['views']) is dict
+    with pytest.raises(KeyError):
+        query['title']
+    assert 'title' not in query
+
+    with pytest.raises(JsonValidationError) as ctx:
+        compile_filters('{"foo": 1}', schema)
+    assert ctx.value.message == 'Columns: foo do not present in resource'
+
+    with pytest.raises(JsonValidationError) as ctx:
+        compile_filters('{"views": {"foo": 1}}', schema)
+    assert ctx.value.message == '_filters query invalid'
+    assert '_filters' in ctx.value.details
+
+
+def test_create_filter_text_index(schema):
+    query = create_filter({'q': 'foo'}, schema)
+    assert '$text' not in query
+    assert len(query['$or']) == 2
+
+    query = create_filter({'q': 'foo', 'views': 1}, schema, text_index=True)
+    assert query == {'$text': {'$search': 'foo'}, 'views': {'$eq': 1}}
+
+
+def test_has_text_index():
+    info = {'_id_': {'key': [('_id', 1)], 'v': 2}}
+    assert not has_text_index(info)
+
+    info['title_text'] = {'key': [('_fts', 'text'), ('_ftsx', 1)], 'v': 2}
+    assert has_text_index(info)
+
+
+def test_compile_relations():
+    fields = {'_id', 'author_id'}
+    relations = compile_relations({'author_id': 'user.username'}, fields)
+    assert relations == {'author_id': ('user', 'username')}
+    assert compile_relations(None, fields) == {}
+
+    with pytest.raises(ValueError):
+        compile_relations({'foo_id': 'user.username'}, fields)
+
+    with pytest.raises(ValueError):
+        compile_relations({'author_id': 'user'}, fields)
+
+
+def test_create_partial_validator(schema):
+    validator = create_partial_validator(schema, '_id')
+    assert validator({'views': '5'}) == {'views': 5}
+    assert validator({'_id': '1' * 24}) == {}
+
+    with pytest.raises(t.DataError):
+        validator({'foo': 1})
+
+
+def test_merge_patch():
+    schema = t.Dict({
+        t.Key('_id'): MongoId,
+        t.Key('title'): t.String,
+        t.Key('note', optional=True): t.String,
+        t.Key('views'): t.ToInt,
+    })
+    validator = create_partial_validator(schema, '_id')
+    required = {'title', 'views'}
+
+    patch = {'views': '5', 'note': None, '_id': None}
+    data, unset = merge_patch(patch, validator, required, '_id')
+    assert data == {'views': 5}
+    assert unset == ['note']
+
+    with pytest.raises(JsonValidationError) as ctx:
+        merge_patch({'title': None}, validator, required, '_id')
+    assert ctx.value.message == 'Required fields can not be removed: title'
+
+    with pytest.raises(JsonValidationError) as ctx:
+        merge_patch({'foo': None}, validator, required, '_id')
+    assert 'foo' in ctx.value.details
+
+    with pytest.raises(JsonValidationError):
+        merge_patch(['views'], validator, required, '_id')
+
+
+def test_validate_array_value():
+    assert validate_array_value(MongoId(), '1' * 24) == ObjectId('1' * 24)
+    assert validate_array_value(t.Int(), '5') == 5
+    assert validate_array_value(t.String(), '5') == '5'
+
+    with pytest.raises(JsonValidationError) as ctx:
+        validate_array_value(t.Int(), 'foo')
+    assert 'value' in ctx.value.details
@@ -1,4 +1,7 @@
+import json
+
 import pytest
+import trafaret as t
 
 from db_fixtures import ADMIN_TYPE_LIST
 
@@ -425,3 +428,881 @@ async def test_delete_entity_that_not_exists(create_admin):
 
     await client.delete(resource, entity_id)
     await client.delete(resource, entity_id)
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.parametrize('sort_dir', ['ASC', 'DESC'])
+@pytest.mark.run_loop
+async def test_list_keyset_pagination_missing_values(create_admin,
+                                                     mongo_collection,
+                                                     sort_dir):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, pagination='keyset')
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    num_entities = 10
+    await create_entities(num_entities)
+    await mongo_collection.update_many({'views': {'$in': [1, 4]}},
+                                       {'$unset': {'views': 1}})
+    await mongo_collection.update_many({'views': 6},
+                                       {'$set': {'views': None}})
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    query = {'_perPage': 2, '_sortField': 'views', '_sortDir': sort_dir,
+             '_after': ''}
+    views = []
+    while query['_after'] is not None:
+        resp = await client.request('GET', url, params=query)
+        rows = await client.handle_response(resp)
+        query['_after'] = resp.headers.get('X-Next-Cursor')
+        views.extend(r.get('views') for r in rows)
+
+    # null and missing values sort first
+    expected = [None] * 3 + [0, 2, 3, 5, 7, 8, 9]
+    if sort_dir == 'DESC':
+        expected.reverse()
+    assert views == expected
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_list_keyset_pagination(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    num_entities = 25
+    await create_entities(num_entities)
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    query = {'_perPage': 10, '_sortField': 'views', '_sortDir': 'ASC',
+             '_after': ''}
+    views, prev_cursor = [], None
+    while query['_after'] is not None:
+        resp = await client.request('GET', url, params=query)
+        rows = await client.handle_response(resp)
+        assert resp.headers['X-Total-Count'] == str(num_entities)
+        prev_cursor = resp.headers.get('X-Prev-Cursor')
+        query['_after'] = resp.headers.get('X-Next-Cursor')
+        views.extend(r['views'] for r in rows)
+
+    assert views == list(range(num_entities))
+
+    query.pop('_after')
+    query['_before'] = prev_cursor
+    resp = await client.request('GET', url, params=query)
+    rows = await client.handle_response(resp)
+    assert [r['views'] for r in rows] == list(range(10, 20))
+
+    # cursor can not be reused with other sort order
+    query['_sortDir'] = 'DESC'
+    resp = await client.request('GET', url, params=query)
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 400
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.parametrize('list_strategy', ['concurrent', 'facet'])
+@pytest.mark.run_loop
+async def test_list_strategy(create_admin, list_strategy):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, list_strategy=list_strategy)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    num_entities = 25
+    await create_entities(num_entities)
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    query = {'_page': 2, '_perPage': 10, '_sortField': 'views',
+             '_sortDir': 'ASC', '_filters': '{"views": {"gt": 3}}'}
+    resp = await client.request('GET', url, params=query)
+    rows = await client.handle_response(resp)
+    assert resp.headers['X-Total-Count'] == '21'
+    assert [r['views'] for r in rows] == list(range(14, 24))
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_list_count_modes(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource,
+                                                        count_cap=10)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    num_entities = 25
+    await create_entities(num_entities)
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    expected = {'exact': '25', 'estimated': '25', 'capped': '10+'}
+    for count_mode, total in expected.items():
+        query = {'_perPage': 10, '_count': count_mode}
+        resp = await client.request('GET', url, params=query)
+        rows = await client.handle_response(resp)
+        assert len(rows) == 10
+        assert resp.headers['X-Total-Count'] == total
+        assert 'X-Has-More' not in resp.headers
+
+    query = {'_page': 2, '_perPage': 10, '_count': 'none'}
+    resp = await client.request('GET', url, params=query)
+    rows = await client.handle_response(resp)
+    assert len(rows) == 10
+    assert 'X-Total-Count' not in resp.headers
+    assert resp.headers['X-Has-More'] == 'true'
+
+    query['_page'] = 3
+    resp = await client.request('GET', url, params=query)
+    rows = await client.handle_response(resp)
+    assert len(rows) == 5
+    assert resp.headers['X-Has-More'] == 'false'
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.parametrize('json_encoder,raw_bson', [('json', False),
+                                                   ('auto', False),
+                                                   ('json', True)])
+@pytest.mark.run_loop
+async def test_list_streaming(create_admin, json_encoder, raw_bson):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, stream_batch_size=4, json_encoder=json_encoder,
+        raw_bson=raw_bson)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    num_entities = 25
+    await create_entities(num_entities)
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    query = {'_perPage': 10, '_sortField': 'views', '_sortDir': 'ASC'}
+    resp = await client.request('GET', url, params=query)
+    expected = await resp.read()
+
+    # streamed body is same as materialized one
+    query['_stream'] = 'true'
+    resp = await client.request('GET', url, params=query)
+    body = await resp.read()
+    assert resp.headers['X-Total-Count'] == str(num_entities)
+    assert body == expected
+
+    query['_format'] = 'ndjson'
+    resp = await client.request('GET', url, params=query)
+    lines = (await resp.text()).splitlines()
+    assert resp.headers['Content-Type'].startswith('application/x-ndjson')
+    assert [json.loads(line) for line in lines] == json.loads(expected)
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_list_streaming_keyset(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, stream_list=True, pagination='keyset')
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    await create_entities(5)
+    url = '{}/{}'.format(client.admin_prefix, resource)
+
+    # keyset pages are not streamed implicitly, so next page is reachable
+    resp = await client.request('GET', url, params={'_perPage': 2})
+    rows = await client.handle_response(resp)
+    assert len(rows) == 2
+    cursor = resp.headers['X-Next-Cursor']
+
+    params = {'_perPage': 2, '_after': cursor}
+    resp = await client.request('GET', url, params=params)
+    next_rows = await client.handle_response(resp)
+    assert len(next_rows) == 2
+    assert 'X-Next-Cursor' in resp.headers
+    assert not {r['_id'] for r in rows} & {r['_id'] for r in next_rows}
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_export(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, export_batch_size=4, export_max_rows=20)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    num_entities = 25
+    await create_entities(num_entities)
+
+    url = '{}/{}/export'.format(client.admin_prefix, resource)
+    query = {'_sortField': 'views', '_sortDir': 'ASC'}
+    resp = await client.request('GET', url, params=query)
+    assert resp.status == 200
+    assert resp.headers['Content-Type'].startswith('text/csv')
+    lines = (await resp.text()).splitlines()
+    assert lines[0].split(',')[:3] == ['_id', 'title', 'category']
+    # header and rows up to export_max_rows
+    assert len(lines) == 21
+
+    query = {'format': 'ndjson', '_limit': 3,
+             '_filters': json.dumps({'views': {'gt': 3}})}
+    resp = await client.request('GET', url, params=query)
+    lines = (await resp.text()).splitlines()
+    assert [json.loads(line)['views'] for line in lines] == [24, 23, 22]
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_compression(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, compression=True, stream_batch_size=4)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    await create_entities(25)
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    query = {'_perPage': 25, '_sortField': 'views', '_sortDir': 'ASC'}
+    gzip = {'Accept-Encoding': 'gzip'}
+
+    resp = await client.request('GET', url, params=query,
+                                headers={'Accept-Encoding': 'identity'})
+    expected = await client.handle_response(resp)
+    assert 'Content-Encoding' not in resp.headers
+    assert 'Accept-Encoding' in resp.headers.getall('Vary')
+
+    # buffered and streamed lists and export are compressed, client
+    # decompresses them
+    streamed = dict(query, _stream='true')
+    for params in (query, streamed):
+        resp = await client.request('GET', url, params=params,
+                                    headers=gzip)
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert await client.handle_response(resp) == expected
+
+    resp = await client.request('GET', url + '/export',
+                                params={'format': 'ndjson'}, headers=gzip)
+    assert resp.status == 200
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    lines = (await resp.text()).splitlines()
+    assert len(lines) == 25
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_fields_projection(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    num_entities = 5
+    await create_entities(num_entities)
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    resp = await client.request('GET', url, params={'_fields': 'title,views'})
+    rows = await client.handle_response(resp)
+    assert len(rows) == num_entities
+    assert all(set(r) == {primary_key, 'title', 'views'} for r in rows)
+
+    entity_id = rows[0][primary_key]
+    entity = await client.detail(resource, entity_id,
+                                 params={'_fields': 'views'})
+    assert entity == {primary_key: entity_id, 'views': rows[0]['views']}
+
+    resp = await client.request('GET', url, params={'_fields': 'foo'})
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 400
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_filter_cache(create_admin):
+    from aiohttp_admin.cache import FilterCache
+
+    filter_cache = FilterCache()
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, filter_cache=filter_cache)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    num_entities = 10
+    await create_entities(num_entities)
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    query = {'_filters': json.dumps({'views': {'in': [1, 2, 3]}})}
+    for _ in range(2):
+        resp = await client.request('GET', url, params=query)
+        rows = await client.handle_response(resp)
+        assert sorted(r['views'] for r in rows) == [1, 2, 3]
+    assert filter_cache.stats.hits == 1
+
+    # validation errors are cached too
+    query = {'_filters': json.dumps({'foo': 1})}
+    for _ in range(2):
+        resp = await client.request('GET', url, params=query)
+        with pytest.raises(client.JsonRestError) as ctx:
+            await client.handle_response(resp)
+        assert ctx.value.status_code == 400
+    assert filter_cache.stats.hits == 2
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_list_text_search(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, text_search='text', text_score_sort=True)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    posts = admin['admin_handler'].resources[0]
+
+    num_entities = 10
+    await create_entities(num_entities)
+
+    # without text index q filter falls back to regex search
+    assert await posts.check_text_index() is False
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    query = {'_filters': json.dumps({'q': 'title 1'})}
+    resp = await client.request('GET', url, params=query)
+    rows = await client.handle_response(resp)
+    assert len(rows) == 1
+
+    await posts._collection.create_index([('title', 'text')])
+    assert await posts.check_text_index() is True
+    query = {'_filters': json.dumps({'q': 'title'})}
+    resp = await client.request('GET', url, params=query)
+    rows = await client.handle_response(resp)
+    assert len(rows) == num_entities
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_get_many(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    num_entities = 5
+    await create_entities(num_entities)
+    rows = await client.list(resource)
+    ids = [r[primary_key] for r in rows]
+
+    missing_id = '1' * 24
+    requested = [ids[3], missing_id, ids[0], 'not_valid_id']
+    url = '{}/{}/many'.format(client.admin_prefix, resource)
+    params = {'ids': ','.join(requested), '_fields': 'views'}
+    resp = await client.request('GET', url, params=params)
+    answer = await client.handle_response(resp)
+    entities = answer['items']
+    assert [e[primary_key] for e in entities] == [ids[3], ids[0]]
+    assert all(set(e) == {primary_key, 'views'} for e in entities)
+    assert answer['missing'] == [missing_id, 'not_valid_id']
+    assert 'X-Missing-Ids' not in resp.headers
+
+    # ids with control characters are returned in body as well
+    params = {'ids': 'abc\r\nX-Evil: 1'}
+    resp = await client.request('GET', url, params=params)
+    answer = await client.handle_response(resp)
+    assert answer == {'items': [], 'missing': ['abc\r\nX-Evil: 1']}
+    assert 'X-Evil' not in resp.headers
+
+    resp = await client.request('GET', url)
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 400
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_expand_relations(create_admin):
+    resource = 'posts'
+    # posts collection refers to itself, so _id is expanded to title
+    admin, client, create_entities = await create_admin(
+        resource, relations={'_id': 'posts.title'})
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    num_entities = 5
+    await create_entities(num_entities)
+
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    params = {'_expand': primary_key, '_fields': 'views'}
+    resp = await client.request('GET', url, params=params)
+    rows = await client.handle_response(resp)
+    assert len(rows) == num_entities
+    for row in rows:
+        title = 'title {}'.format(row['views'])
+        assert row['_expanded'] == {primary_key: title}
+
+    entity_id = rows[0][primary_key]
+    entity = await client.detail(resource, entity_id,
+                                 params={'_expand': primary_key})
+    assert entity['_expanded'] == {primary_key: entity['title']}
+
+    resp = await client.request('GET', url, params={'_expand': 'title'})
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 400
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_bulk_create(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    def entity(i, **kw):
+        data = {'title': 'title {}'.format(i),
+                'category': 'category field',
+                'body': 'body field',
+                'views': i,
+                'average_note': 0.1,
+                'published_at': '2016-02-27T22:33:04',
+                'status': 'c',
+                'visible': True}
+        data.update(kw)
+        return data
+
+    payload = [entity(0), entity(1, views='foo'), entity(2)]
+    url = '{}/{}/bulk'.format(client.admin_prefix, resource)
+    resp = await client.request('POST', url, data=payload)
+    body = await client.handle_response(resp)
+    assert body['created'] == 2
+    assert body['failed'] == 1
+    results = body['results']
+    assert primary_key in results[0] and primary_key in results[2]
+    assert 'views' in results[1]['error_details']
+
+    rows = await client.list(resource)
+    assert sorted(r['views'] for r in rows) == [0, 2]
+
+    resp = await client.request('POST', url, data={})
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 400
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_bulk_update_and_delete(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    num_entities = 10
+    await create_entities(num_entities)
+    rows = await client.list(resource)
+    ids = {r['views']: r[primary_key] for r in rows}
+
+    url = '{}/{}/bulk'.format(client.admin_prefix, resource)
+    filters = json.dumps({'views': {'lt': 3}})
+    params = {'_filters': filters, '_dryRun': 'true'}
+    resp = await client.request('PUT', url, data={'status': 'a'},
+                                params=params)
+    assert await client.handle_response(resp) == {'matched': 3}
+
+    resp = await client.request('PUT', url, data={'status': 'a'},
+                                params={'_filters': filters})
+    assert await client.handle_response(resp) == {'matched': 3,
+                                                  'modified': 3}
+
+    params = {'ids': ','.join([ids[5], ids[6]])}
+    resp = await client.request('PUT', url, data={'status': 'b'},
+                                params=params)
+    assert await client.handle_response(resp) == {'matched': 2,
+                                                  'modified': 2}
+
+    updates = [{'id': ids[7], 'data': {'views': 70}},
+               {'id': ids[8], 'data': {'title': 'title 80'}}]
+    resp = await client.request('PUT', url, data=updates)
+    assert await client.handle_response(resp) == {'matched': 2,
+                                                  'modified': 2}
+
+    rows = await client.list(resource)
+    status = {r['title']: r['status'] for r in rows}
+    assert [status['title {}'.format(i)] for i in range(3)] == ['a'] * 3
+    assert status['title 5'] == status['title 6'] == 'b'
+    assert status['title 80'] == 'c'
+    assert 70 in [r['views'] for r in rows]
+
+    # whole collection is never selected implicitly
+    resp = await client.request('DELETE', url)
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 400
+
+    resp = await client.request('DELETE', url, params={'_filters': filters})
+    assert await client.handle_response(resp) == {'matched': 3,
+                                                  'deleted': 3}
+    rows = await client.list(resource)
+    assert len(rows) == num_entities - 3
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_bulk_update_write_errors(create_admin, mongo_collection):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    await create_entities(5)
+    await mongo_collection.create_index('title', unique=True)
+    rows = await client.list(resource)
+    ids = {r['views']: r[primary_key] for r in rows}
+
+    # failed updates do not stop the rest
+    url = '{}/{}/bulk'.format(client.admin_prefix, resource)
+    updates = [{'id': ids[1], 'data': {'title': 'title 0'}},
+               {'id': ids[2], 'data': {'views': 20}},
+               {'id': ids[3], 'data': {'title': 'title 0'}}]
+    resp = await client.request('PUT', url, data=updates)
+    answer = await client.handle_response(resp)
+    assert answer['matched'] == answer['modified'] == 1
+    assert [e['id'] for e in answer['errors']] == [ids[1], ids[3]]
+    assert all(e['error_details']['code'] == 11000
+               for e in answer['errors'])
+
+    # update of filtered documents stops at first error, caches are
+    # dropped, so written documents are visible
+    params = {'_filters': json.dumps({'views': {'lt': 5}})}
+    resp = await client.request('PUT', url, data={'title': 'same'},
+                                params=params)
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 409
+    rows = await client.list(resource)
+    assert 20 in [r['views'] for r in rows]
+    assert [r['title'] for r in rows].count('same') == 1
+
+    # empty update is rejected before anything is written
+    updates = [{'id': ids[4], 'data': {}}]
+    resp = await client.request('PUT', url, data=updates)
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.handle_response(resp)
+    assert ctx.value.status_code == 400
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.parametrize('return_policy', ['full', 'id_only', 'none'])
+@pytest.mark.run_loop
+async def test_return_policy(create_admin, return_policy):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, return_policy=return_policy)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    entity = {'title': 'title test_return_policy',
+              'category': 'category field',
+              'body': 'body field',
+              'views': 42,
+              'average_note': 0.1,
+              'published_at': '2016-02-27T22:33:04.123456+03:00',
+              'status': 'c',
+              'visible': True}
+    created = await client.create(resource, entity)
+    rows = await client.list(resource)
+    assert len(rows) == 1
+    stored = rows[0]
+    entity_id = stored[primary_key]
+
+    entity['views'] = 43
+    updated = await client.update(resource, entity_id, entity)
+    if return_policy == 'full':
+        # created document is the stored one, not payload as sent
+        assert stored['published_at'] == '2016-02-27T19:33:04.123000'
+        assert created == stored
+        assert updated['views'] == 43
+    elif return_policy == 'id_only':
+        assert created == {primary_key: entity_id}
+        assert updated == {primary_key: entity_id}
+    else:
+        assert created == {'status': 'created'}
+        assert updated == {'status': 'updated'}
+
+    await client.delete(resource, entity_id)
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.update(resource, entity_id, entity)
+    assert ctx.value.status_code == 404
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_patch(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    await create_entities(1)
+    entity = (await client.list(resource))[0]
+    entity_id = entity[primary_key]
+
+    url = '{}/{}/{}'.format(client.admin_prefix, resource, entity_id)
+    resp = await client.request('PATCH', url, data={'views': '100'})
+    doc = await client.handle_response(resp)
+    assert doc['views'] == 100
+    assert doc['title'] == entity['title']
+
+    # required fields can not be removed, unknown are rejected
+    for patch in ({'title': None}, {'foo': 1}, {}):
+        resp = await client.request('PATCH', url, data=patch)
+        with pytest.raises(client.JsonRestError) as ctx:
+            await client.handle_response(resp)
+        assert ctx.value.status_code == 400
+
+    entity = await client.detail(resource, entity_id)
+    assert entity['views'] == 100
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_add_and_remove_items(create_admin, document_schema):
+    resource = 'posts'
+    schema = document_schema.merge(
+        [t.Key('tags', optional=True, trafaret=t.List(t.ToInt()))])
+    admin, client, create_entities = await create_admin(resource,
+                                                        schema=schema)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    await create_entities(1)
+    entity = (await client.list(resource))[0]
+    entity_id = entity[primary_key]
+
+    url = '{}/{}/{}/tags'.format(client.admin_prefix, resource, entity_id)
+    resp = await client.request('POST', url, data={'values': [1, '2']})
+    assert await client.handle_response(resp) == {'status': 'updated'}
+    resp = await client.request('POST', url, data={'values': [2]})
+    assert await client.handle_response(resp) == {'status': 'unchanged'}
+
+    # /{entity_id}/{field} routes do not shadow /{entity_id}
+    entity = await client.detail(resource, entity_id)
+    assert entity['tags'] == [1, 2]
+
+    resp = await client.request('DELETE', url + '/1')
+    assert await client.handle_response(resp) == {'status': 'updated'}
+    resp = await client.request('DELETE', url + '/1')
+    assert await client.handle_response(resp) == {'status': 'unchanged'}
+    entity = await client.detail(resource, entity_id)
+    assert entity['tags'] == [2]
+
+    # elements are validated with trafaret of the list, only list
+    # fields are accepted
+    title_url = '{}/{}/{}/title'.format(client.admin_prefix, resource,
+                                        entity_id)
+    requests = [('POST', url, {'values': ['x']}),
+                ('POST', url, {'values': []}),
+                ('POST', url, {'tags': [3]}),
+                ('DELETE', url + '/x', None),
+                ('POST', title_url, {'values': ['x']})]
+    for method, path, data in requests:
+        resp = await client.request(method, path, data=data)
+        with pytest.raises(client.JsonRestError) as ctx:
+            await client.handle_response(resp)
+        assert ctx.value.status_code == 400
+
+    missing_url = '{}/{}/{}/tags'.format(client.admin_prefix, resource,
+                                         '0' * 24)
+    for method, path, data in [('POST', missing_url, {'values': [1]}),
+                               ('DELETE', missing_url + '/1', None)]:
+        resp = await client.request(method, path, data=data)
+        with pytest.raises(client.JsonRestError) as ctx:
+            await client.handle_response(resp)
+        assert ctx.value.status_code == 404
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_array_slice_and_length(create_admin, document_schema):
+    resource = 'posts'
+    schema = document_schema.merge(
+        [t.Key('tags', optional=True, trafaret=t.List(t.ToInt()))])
+    admin, client, create_entities = await create_admin(
+        resource, schema=schema, array_slice_cap=3)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    await create_entities(1)
+    entity = (await client.list(resource))[0]
+    entity_id = entity[primary_key]
+
+    url = '{}/{}/{}/tags'.format(client.admin_prefix, resource, entity_id)
+    resp = await client.request('POST', url, data={'values': list(range(5))})
+    await client.handle_response(resp)
+
+    # list field is capped, other fields are returned as is
+    path = '{}/{}/{}'.format(client.admin_prefix, resource, entity_id)
+    resp = await client.request('GET', path)
+    doc = await client.handle_response(resp)
+    assert doc['tags'] == [0, 1, 2]
+    assert doc['title'] == entity['title']
+    assert resp.headers['X-Sliced-Fields'] == 'tags'
+
+    # list field is not sliced when it is not requested
+    resp = await client.request('GET', path, params={'_fields': 'title'})
+    await client.handle_response(resp)
+    assert 'X-Sliced-Fields' not in resp.headers
+
+    params = {'_slice': 'tags:-2:2', '_fields': 'title'}
+    doc = await client.detail(resource, entity_id, params=params)
+    assert doc == {primary_key: entity_id, 'title': entity['title'],
+                   'tags': [3, 4]}
+
+    params = {'_slice': 'tags:1:10'}
+    doc = await client.detail(resource, entity_id, params=params)
+    assert doc['tags'] == [1, 2, 3]
+
+    resp = await client.request('GET', url + '/length')
+    assert await client.handle_response(resp) == {'length': 5}
+
+    for path, status in [(url.replace(entity_id, '0' * 24), 404),
+                         (url.replace('tags', 'title'), 400)]:
+        resp = await client.request('GET', path + '/length')
+        with pytest.raises(client.JsonRestError) as ctx:
+            await client.handle_response(resp)
+        assert ctx.value.status_code == status
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.parametrize('json_encoder', ['json', 'auto'])
+@pytest.mark.run_loop
+async def test_json_encoder(create_admin, json_encoder):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, json_encoder=json_encoder)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    await create_entities(2)
+    rows = await client.list(resource)
+    assert len(rows) == 2
+    entity = await client.detail(resource, rows[0][primary_key])
+    assert entity == rows[0]
+    assert isinstance(entity['published_at'], str)
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_msgpack_negotiation(create_admin):
+    pytest.importorskip('msgpack')
+    from aiohttp_admin.encoders import dumps_msgpack, loads_msgpack
+
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    await create_entities(3)
+    rows = await client.list(resource)
+    url = '{}/{}'.format(client.admin_prefix, resource)
+    msgpack_headers = {'Accept': 'application/msgpack'}
+
+    resp = await client.request('GET', url, headers=msgpack_headers)
+    assert resp.status == 200
+    assert resp.content_type == 'application/msgpack'
+    assert resp.headers['Vary'] == 'Accept'
+    answer = loads_msgpack(await resp.read())
+    assert [str(r[primary_key]) for r in answer] == [
+        r[primary_key] for r in rows]
+
+    entity_id = rows[0][primary_key]
+    detail_url = '{}/{}'.format(url, entity_id)
+    resp = await client.request('GET', detail_url, headers=msgpack_headers)
+    doc = loads_msgpack(await resp.read())
+    assert str(doc[primary_key]) == entity_id
+    assert doc['title'] == rows[0]['title']
+    assert doc['published_at'].tzinfo is not None
+
+    # JSON stays the default, Vary is sent for it as well
+    resp = await client.request('GET', detail_url)
+    assert resp.content_type == 'application/json'
+    assert resp.headers['Vary'] == 'Accept'
+    assert await client.handle_response(resp) == rows[0]
+
+    entity = {'title': 'title test_msgpack',
+              'category': 'category field',
+              'body': 'body field',
+              'views': 42,
+              'average_note': 0.1,
+              'published_at': '2016-02-27T22:33:04',
+              'status': 'c',
+              'visible': True}
+    headers = {'Content-Type': 'application/msgpack'}
+    headers.update(msgpack_headers)
+    resp = await client.request('POST', url, data=dumps_msgpack(entity),
+                                headers=headers, json_dumps=False)
+    assert resp.content_type == 'application/msgpack'
+    created = loads_msgpack(await resp.read())
+    assert created['title'] == entity['title']
+    assert created['views'] == 42
+
+    # broken msgpack payload is rejected same as broken JSON
+    resp = await client.request('POST', url, data=b'\xc1', headers=headers,
+                                json_dumps=False)
+    assert resp.status == 400
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_raw_bson(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(
+        resource, raw_bson=True)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+    primary_key = admin['admin_handler'].resources[0].primary_key
+
+    await create_entities(5)
+    rows = await client.list(resource)
+    assert len(rows) == 5
+    entity = await client.detail(resource, rows[0][primary_key])
+    assert entity == rows[0]
+    assert isinstance(entity['published_at'], str)
+
+    with pytest.raises(client.JsonRestError) as ctx:
+        await client.detail(resource, 'not-an-id')
+    assert ctx.value.status_code == 404
+
+
+@pytest.mark.parametrize('admin_type', ['mongo'])
+@pytest.mark.run_loop
+async def test_list_columnar(create_admin):
+    resource = 'posts'
+    admin, client, create_entities = await create_admin(resource)
+    token = await client.token('admin', 'admin')
+    client.set_token(token)
+
+    await create_entities(5)
+    rows = await client.list(resource)
+    columnar_rows = await client.list(resource, columnar=True)
+    assert columnar_rows == rows
+
+    # primary key is a column even when it is not in _fields
+    params = {'_fields': 'title,views'}
+    rows = await client.list(resource, params=params)
+    answer = await client.list(resource, params=params, columnar=True)
+    assert answer == rows
+    assert sorted(answer[0]) == ['_id', 'title', 'views']
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import pytest
 import trafaret as t
@@ -5,8 +6,11 @@ import trafaret as t
 from bson import ObjectId
 
 from aiohttp_admin.exceptions import JsonValidationError
-from aiohttp_admin.utils import (validate_query_structure, jsonify,
-                                 validate_payload, as_dict, SimpleType)
+from aiohttp_admin.utils import (validate_query_structure, validate_query,
+                                 jsonify, validate_payload, as_dict,
+                                 SimpleType, gather_or_cancel,
+                                 validate_bulk_data, DetailQuery,
+                                 columnar, list_separator)
 
 
 def test_validate_query_empty_defaults():
@@ -78,6 +82,40 @@ def test_validate_query_filters_invalid():
     assert error['error'] == '_filters query invalid'
 
 
+def test_validate_query_both_cursors():
+    query = {'_after': 'foo', '_before': 'bar'}
+
+    with pytest.raises(JsonValidationError) as ctx:
+        validate_query(query, ['views'])
+
+    error = json.loads(ctx.value.text)
+    assert error['error'] == ('Only one of _after and _before cursors '
+                              'can be supplied')
+
+
+def test_validate_query_fields():
+    q = validate_query({'_fields': 'title, views'}, ['title', 'views'])
+    assert q['_fields'] == ['title', 'views']
+
+    with pytest.raises(JsonValidationError) as ctx:
+        validate_query({'_fields': 'title,foo'}, ['title', 'views'])
+
+    error = json.loads(ctx.value.text)
+    assert error['error'] == 'Columns: foo do not present in resource'
+
+
+def test_validate_query_slice():
+    query = {'_slice': 'whom_id:0:100, tags:-10:5'}
+    q = validate_query(query, ['whom_id', 'tags'], DetailQuery)
+    assert q['_slice'] == {'whom_id': (0, 100), 'tags': (-10, 5)}
+
+    for value in ('whom_id:0', 'whom_id:a:1', 'whom_id:0:0'):
+        with pytest.raises(JsonValidationError) as ctx:
+            validate_query({'_slice': value}, ['whom_id'], DetailQuery)
+        error = json.loads(ctx.value.text)
+        assert error['error'] == 'Query arguments invalid: _slice'
+
+
 def test_jsonify():
     obj = {'foo': 'bar'}
     jsoned = jsonify(obj)
@@ -117,6 +155,27 @@ def test_validate_payload_not_json():
     assert error['error'] == 'Payload is not json serialisable'
 
 
+def test_validate_bulk_data():
+    parsed = [{'foo': 'bar'}, {'foo': 'baz'}]
+    schema = t.Dict({
+        t.Key('foo'): t.Atom('bar')
+    })
+    items = validate_bulk_data(parsed, schema, max_items=2)
+    assert items[0] == ({'foo': 'bar'}, None)
+    data, error = items[1]
+    assert data is None
+    assert error['error'] == 'Invalid json payload'
+    assert 'foo' in error['error_details']
+
+    with pytest.raises(JsonValidationError) as ctx:
+        validate_bulk_data(parsed, schema, max_items=1)
+    error = json.loads(ctx.value.text)
+    assert error['error'] == 'Too many items, at most 1 are allowed'
+
+    with pytest.raises(JsonValidationError):
+        validate_bulk_data({'foo': 'bar'}, schema, max_items=2)
+
+
 def test_validate_payload_not_valid_schema():
     raw_data = b'{"baz": "bar"}'
     schema = t.Dict({
@@ -140,3 +199,46 @@ def test_as_dict():
 
     resp = as_dict(exc, 'boom')
     assert isinstance(resp, dict)
+
+
+@pytest.mark.run_loop
+async def test_gather_or_cancel(loop):
+    async def value(v):
+        return v
+
+    result = await gather_or_cancel(value(1), value(2))
+    assert result == [1, 2]
+
+
+@pytest.mark.run_loop
+async def test_gather_or_cancel_failed(loop):
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def failed():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        await gather_or_cancel(slow(), failed())
+    assert cancelled == [True]
+
+
+def test_columnar():
+    docs = [{'_id': 1, 'title': 'foo', 'views': 3},
+            {'_id': 2, 'views': 4}]
+    result = columnar(docs, ['_id', 'title', 'views'])
+    assert result == {'fields': ['_id', 'title', 'views'],
+                      'rows': [[1, 'foo', 3], [2, None, 4]]}
+    assert columnar([], ['_id']) == {'fields': ['_id'], 'rows': []}
+
+
+def test_list_separator():
+    assert list_separator(jsonify) == b', '
+    assert list_separator(
+        lambda obj: json.dumps(obj, separators=(',', ':')).encode()) == b','